@@ -0,0 +1,146 @@
+"""
+Difusión en vivo de ocupación por Server-Sent Events
+"""
+import asyncio
+import json
+import logging
+from datetime import datetime
+from typing import AsyncIterator, Awaitable, Callable, Optional, Set
+from app.config import get_settings
+
+settings = get_settings()
+logger = logging.getLogger(__name__)
+
+
+class Subscriber:
+    """Suscriptor del feed con su propia cola acotada"""
+
+    __slots__ = ("queue", "dropped")
+
+    def __init__(self, max_queue_size: int):
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=max_queue_size)
+        self.dropped = False
+
+
+class OccupancyBroadcaster:
+    """
+    Difusor en proceso de cifras de ocupación hacia clientes SSE
+
+    Cada evento se serializa una sola vez y se reparte a todos los
+    suscriptores. Si la cola de un cliente se llena (cliente lento),
+    el cliente se desconecta en lugar de acumular mensajes sin límite.
+    """
+
+    def __init__(self, max_queue_size: int = 16):
+        self.max_queue_size = max_queue_size
+        self._subscribers: Set[Subscriber] = set()
+        self._latest: Optional[str] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self.dropped_total = 0
+
+    @property
+    def subscriber_count(self) -> int:
+        """Número de clientes conectados"""
+        return len(self._subscribers)
+
+    def bind_loop(self, loop: asyncio.AbstractEventLoop):
+        """Registrar el event loop donde viven los suscriptores"""
+        self._loop = loop
+
+    def subscribe(self) -> Subscriber:
+        """Registrar un nuevo cliente y entregarle el último estado conocido"""
+        subscriber = Subscriber(self.max_queue_size)
+        if self._latest is not None:
+            subscriber.queue.put_nowait(self._latest)
+        self._subscribers.add(subscriber)
+        return subscriber
+
+    def unsubscribe(self, subscriber: Subscriber):
+        """Eliminar un cliente del difusor"""
+        self._subscribers.discard(subscriber)
+
+    def publish(self, payload: dict):
+        """
+        Difundir cifras a todos los suscriptores (debe llamarse desde el event loop)
+
+        Args:
+            payload: Datos de ocupación a enviar
+        """
+        frame = format_sse(payload, event="occupancy")
+        self._latest = frame
+
+        for subscriber in list(self._subscribers):
+            try:
+                subscriber.queue.put_nowait(frame)
+            except asyncio.QueueFull:
+                self._drop(subscriber)
+
+    def publish_threadsafe(self, payload: dict):
+        """Difundir cifras desde un hilo distinto al del event loop"""
+        if self._loop is None or self._loop.is_closed():
+            logger.warning("Difusor sin event loop, se descarta la actualización")
+            return
+        self._loop.call_soon_threadsafe(self.publish, payload)
+
+    def _drop(self, subscriber: Subscriber):
+        """Desconectar a un cliente lento liberando su cola"""
+        self._subscribers.discard(subscriber)
+        subscriber.dropped = True
+        self.dropped_total += 1
+
+        # Vaciar la cola y dejar solo la marca de cierre
+        while not subscriber.queue.empty():
+            subscriber.queue.get_nowait()
+        subscriber.queue.put_nowait(None)
+        logger.warning("Cliente SSE lento desconectado por contrapresión")
+
+    async def stream(
+        self,
+        subscriber: Subscriber,
+        is_disconnected: Callable[[], Awaitable[bool]],
+        keepalive: float
+    ) -> AsyncIterator[str]:
+        """
+        Generar los frames SSE de un suscriptor hasta que se desconecte
+
+        Args:
+            subscriber: Suscriptor registrado con subscribe()
+            is_disconnected: Corrutina que indica si el cliente cerró la conexión
+            keepalive: Segundos sin datos antes de enviar un comentario de keep-alive
+
+        Yields:
+            str: Frames con formato text/event-stream
+        """
+        try:
+            while True:
+                try:
+                    frame = await asyncio.wait_for(subscriber.queue.get(), timeout=keepalive)
+                except asyncio.TimeoutError:
+                    if await is_disconnected():
+                        break
+                    yield ": keep-alive\n\n"
+                    continue
+
+                if frame is None:
+                    break
+                yield frame
+        finally:
+            self.unsubscribe(subscriber)
+
+
+def format_sse(payload: dict, event: str) -> str:
+    """Serializar un evento con formato Server-Sent Events"""
+    data = json.dumps(payload, default=str, separators=(",", ":"))
+    return f"event: {event}\ndata: {data}\n\n"
+
+
+def build_occupancy_payload(by_hotel: list) -> dict:
+    """Construir el mensaje de ocupación por hotel que se envía a los clientes"""
+    return {
+        "timestamp": datetime.now().isoformat(),
+        "by_hotel": by_hotel
+    }
+
+
+# Instancia global del difusor
+occupancy_broadcaster = OccupancyBroadcaster(max_queue_size=settings.stream_queue_size)
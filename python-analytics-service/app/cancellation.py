@@ -0,0 +1,352 @@
+"""
+Cancelación de consultas cuando el cliente se desconecta o vence el plazo de la petición
+
+La consulta se ejecuta en el threadpool mientras la corrutina de la petición
+vigila la desconexión del cliente y el plazo. Si alguno se cumple, se cancela
+la sentencia en curso con el mecanismo del driver (PQcancel) y la conexión se
+invalida en lugar de volver al pool. La sesión cancelada pasa a ser del hilo
+que la usa, que la cierra al terminar; la petición puede responder antes.
+"""
+import asyncio
+import logging
+import os
+import threading
+import time
+from typing import Callable, Optional, TypeVar
+from fastapi import HTTPException, Request
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+from starlette.concurrency import run_in_threadpool
+from app.config import get_settings
+from app.database import SESSION_HANDED_OFF, SessionLocal
+from app.shared_cache import SharedSlot, worker_metrics_slot
+
+settings = get_settings()
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+# Código de nginx para "el cliente cerró la conexión"
+CLIENT_CLOSED_REQUEST = 499
+
+
+class RequestCancelled(Exception):
+    """La petición se abandonó antes de terminar sus consultas"""
+
+    def __init__(self, reason: str):
+        super().__init__(f"Petición cancelada ({reason})")
+        self.reason = reason
+
+
+class CancelToken:
+    """Estado de cancelación de una petición, compartido con el hilo que ejecuta las consultas"""
+
+    def __init__(self):
+        self.reason: Optional[str] = None
+        self.db_started_at: Optional[float] = None
+        self._driver_connection = None
+        self._finished = False
+        self._lock = threading.Lock()
+
+    @property
+    def cancelled(self) -> bool:
+        return self.reason is not None
+
+    def attach(self, driver_connection):
+        """Registrar la conexión del driver sobre la que se ejecutan las consultas"""
+        with self._lock:
+            self._driver_connection = driver_connection
+            if self.db_started_at is None:
+                self.db_started_at = time.perf_counter()
+        self.check()
+
+    def check(self):
+        """Lanzar RequestCancelled si la petición ya se canceló"""
+        if self.reason is not None:
+            raise RequestCancelled(self.reason)
+
+    def cancel(self, reason: str) -> bool:
+        """
+        Marcar la petición como cancelada e interrumpir la sentencia en curso
+
+        Returns:
+            bool: False si el trabajo ya había terminado y no hay nada que cancelar
+        """
+        with self._lock:
+            if self._finished:
+                return False
+            self.reason = reason
+            connection = self._driver_connection
+        if connection is not None:
+            try:
+                # Envía la petición de cancelación por una conexión aparte; es seguro desde otro hilo
+                connection.cancel()
+            except Exception as e:
+                logger.warning(f"No se pudo cancelar la consulta en curso: {e}")
+        return True
+
+    def finish(self) -> bool:
+        """
+        Marcar el trabajo como terminado (desde el hilo que lo ejecuta)
+
+        Returns:
+            bool: True si se canceló antes de terminar; el hilo debe cerrar la sesión
+        """
+        with self._lock:
+            self._finished = True
+            return self.reason is not None
+
+
+@event.listens_for(SessionLocal, "after_begin")
+def _attach_connection(session: Session, transaction, connection):
+    """Asociar cada conexión que abre la sesión al token de la petición"""
+    token = session.info.get("cancel_token")
+    if token is not None:
+        token.attach(connection.connection.driver_connection)
+
+
+@event.listens_for(SessionLocal, "do_orm_execute")
+def _check_cancelled(orm_execute_state):
+    """No lanzar más sentencias de una petición ya cancelada"""
+    token = orm_execute_state.session.info.get("cancel_token")
+    if token is not None:
+        token.check()
+
+
+def check_cancelled(db: Session):
+    """Comprobación explícita para las rutas que usan el driver directamente"""
+    token = db.info.get("cancel_token")
+    if token is not None:
+        token.check()
+
+
+class CancellationMetrics:
+    """
+    Consultas canceladas y segundos de base de datos ahorrados
+
+    Cada worker de gunicorn cuenta lo suyo. Si se pasa un SharedSlot, cada
+    worker publica su parte bajo su pid y snapshot() suma la de todos, de
+    modo que /metrics devuelve lo mismo lo atienda el worker que lo atienda.
+    """
+
+    # Peso de la última ejecución en la media móvil de duración
+    ALPHA = 0.2
+
+    def __init__(self, shared: Optional[SharedSlot] = None):
+        self.shared = shared
+        self._lock = threading.Lock()
+        self._reset()
+
+    def _reset(self):
+        """Empezar de cero en el proceso actual (también tras un fork)"""
+        self._pid = os.getpid()
+        # El pid puede reutilizarse tras reiniciar un worker: la clave incluye el arranque
+        self._key = f"{self._pid}-{int(time.time())}"
+        self._avg_seconds = {}
+        self._completed = {}
+        self.cancelled = {"disconnect": 0, "deadline": 0}
+        self.db_seconds_saved = 0.0
+
+    def observe(self, operation: str, seconds: float):
+        """Registrar la duración de una operación que terminó normalmente"""
+        with self._lock:
+            self._check_pid()
+            avg = self._avg_seconds.get(operation)
+            self._avg_seconds[operation] = seconds if avg is None else avg + self.ALPHA * (seconds - avg)
+            self._completed[operation] = self._completed.get(operation, 0) + 1
+            local = self._local_snapshot()
+        self._publish(local)
+
+    def record_cancel(self, operation: str, reason: str, db_elapsed: float) -> float:
+        """
+        Registrar una cancelación
+
+        El ahorro se estima como la duración media de la operación menos
+        lo que ya llevaba ejecutándose en la base de datos.
+
+        Returns:
+            Segundos de base de datos ahorrados (estimados)
+        """
+        with self._lock:
+            self._check_pid()
+            saved = max(self._avg_seconds.get(operation, 0.0) - db_elapsed, 0.0)
+            self.cancelled[reason] = self.cancelled.get(reason, 0) + 1
+            self.db_seconds_saved += saved
+            local = self._local_snapshot()
+        self._publish(local)
+        return saved
+
+    def _check_pid(self):
+        """Con GUNICORN_PRELOAD la instancia se crea en el master: no heredar sus cifras"""
+        if self._pid != os.getpid():
+            self._reset()
+
+    def _local_snapshot(self) -> dict:
+        """Cifras de este proceso (llamar con el lock tomado)"""
+        return {
+            "pid": self._pid,
+            "cancelled": dict(self.cancelled),
+            "db_seconds_saved": self.db_seconds_saved,
+            "operations": {
+                name: {"completed": self._completed[name], "avg_seconds": avg}
+                for name, avg in self._avg_seconds.items()
+            }
+        }
+
+    def _publish(self, local: dict):
+        """Guardar las cifras de este worker en el slot compartido"""
+        if self.shared is None:
+            return
+        key = self._key
+
+        def _merge(workers):
+            workers = workers or {}
+            workers[key] = local
+            return workers
+
+        try:
+            self.shared.update(_merge)
+        except OSError as e:
+            logger.warning(f"No se pudieron compartir las métricas de cancelación: {e}")
+
+    def snapshot(self) -> dict:
+        """
+        Estado actual de las métricas
+
+        Con slot compartido suma las cifras de todos los workers (incluidos
+        los que ya terminaron); sin él solo las de este proceso.
+        """
+        with self._lock:
+            self._check_pid()
+            workers = {self._key: self._local_snapshot()}
+        if self.shared is not None:
+            try:
+                entry = self.shared.read()
+            except OSError as e:
+                logger.warning(f"No se pudieron leer las métricas compartidas: {e}")
+                entry = None
+            if entry is not None:
+                workers = {**entry[1], **workers}
+        return self._aggregate(workers, scope="all_workers" if self.shared is not None else "worker")
+
+    @staticmethod
+    def _aggregate(workers: dict, scope: str) -> dict:
+        """Sumar contadores y ponderar las medias por operaciones completadas"""
+        cancelled, saved, completed, weighted = {}, 0.0, {}, {}
+        for local in workers.values():
+            for reason, count in local["cancelled"].items():
+                cancelled[reason] = cancelled.get(reason, 0) + count
+            saved += local["db_seconds_saved"]
+            for name, op in local["operations"].items():
+                completed[name] = completed.get(name, 0) + op["completed"]
+                weighted[name] = weighted.get(name, 0.0) + op["avg_seconds"] * op["completed"]
+        return {
+            "scope": scope,
+            "workers": len(workers),
+            "pids": sorted(local["pid"] for local in workers.values()),
+            "cancelled": cancelled,
+            "cancelled_total": sum(cancelled.values()),
+            "db_seconds_saved": round(saved, 3),
+            "operations": {
+                name: {
+                    "completed": count,
+                    "avg_ms": round(weighted[name] / count * 1000, 3) if count else 0.0
+                }
+                for name, count in completed.items()
+            }
+        }
+
+
+def request_deadline(request: Request, route_seconds: float) -> float:
+    """
+    Plazo de la petición en segundos
+
+    Usa el menor entre el configurado para la ruta y la cabecera
+    REQUEST_DEADLINE_HEADER (p. ej. el timeout del balanceador).
+    """
+    header = request.headers.get(settings.request_deadline_header)
+    if header:
+        try:
+            value = float(header)
+            if value > 0:
+                return min(value, route_seconds)
+        except ValueError:
+            logger.warning(f"Cabecera {settings.request_deadline_header} inválida: {header}")
+    return route_seconds
+
+
+async def run_cancellable(
+    request: Request,
+    db: Session,
+    fn: Callable[[], T],
+    operation: str,
+    timeout: float
+) -> T:
+    """
+    Ejecutar trabajo de base de datos cancelable por desconexión o plazo
+
+    Args:
+        request: Petición en curso (para detectar la desconexión)
+        db: Sesión usada por fn
+        fn: Función síncrona que ejecuta las consultas
+        operation: Nombre de la operación para las métricas
+        timeout: Plazo de la ruta en segundos
+
+    Returns:
+        El resultado de fn
+
+    Raises:
+        HTTPException: 504 si vence el plazo, 499 si el cliente se desconectó
+    """
+    token = CancelToken()
+    deadline = time.perf_counter() + request_deadline(request, timeout)
+
+    def _run():
+        db.info["cancel_token"] = token
+        try:
+            result = fn()
+            if token.db_started_at is not None:
+                cancellation_metrics.observe(operation, time.perf_counter() - token.db_started_at)
+            return result
+        finally:
+            db.info.pop("cancel_token", None)
+            if token.finish():
+                # La sesión cancelada pertenece a este hilo: get_db ya no la cierra.
+                # La conexión puede tener una sentencia a medio cancelar: no devolverla al pool.
+                db.invalidate()
+
+    task = asyncio.ensure_future(run_in_threadpool(_run))
+    reason = None
+    while reason is None:
+        remaining = deadline - time.perf_counter()
+        done, _ = await asyncio.wait({task}, timeout=max(min(settings.disconnect_poll_seconds, remaining), 0))
+        if done:
+            return task.result()
+        if await request.is_disconnected():
+            reason = "disconnect"
+        elif time.perf_counter() >= deadline:
+            reason = "deadline"
+
+    if not token.cancel(reason):
+        # El trabajo terminó justo antes de cancelarlo
+        return await task
+    # A partir de aquí el hilo cierra la sesión; get_db no debe tocarla
+    db.info[SESSION_HANDED_OFF] = True
+    db_elapsed = time.perf_counter() - token.db_started_at if token.db_started_at is not None else 0.0
+    saved = cancellation_metrics.record_cancel(operation, reason, db_elapsed)
+    logger.warning(f"{operation} cancelada ({reason}) tras {db_elapsed:.2f}s en BD, ahorro estimado {saved:.2f}s")
+
+    # Esperar brevemente a que el hilo libere la conexión; si no, terminará por su cuenta
+    try:
+        await asyncio.wait_for(asyncio.shield(task), settings.cancel_grace_seconds)
+    except Exception:
+        pass
+    task.add_done_callback(lambda t: t.cancelled() or t.exception())
+
+    if reason == "deadline":
+        raise HTTPException(status_code=504, detail=f"Plazo de la petición agotado ({operation})")
+    raise HTTPException(status_code=CLIENT_CLOSED_REQUEST, detail="Cliente desconectado")
+
+
+# Instancia global de métricas de cancelación (agregadas entre workers si la caché compartida está activa)
+cancellation_metrics = CancellationMetrics(worker_metrics_slot if settings.shared_cache_enabled else None)
@@ -14,6 +14,9 @@ class Settings(BaseSettings):
     db_name: str = "booking_db"
     db_user: str = "booking_user"
     db_password: str = "booking_password"
+    db_connect_timeout: int = 5
+    db_prepared_statements: bool = True
+    db_prepare_threshold: int = 5
     
     # RabbitMQ
     rabbitmq_host: str = "rabbitmq"
@@ -21,6 +24,7 @@ class Settings(BaseSettings):
     rabbitmq_user: str = "guest"
     rabbitmq_password: str = "guest"
     rabbitmq_queue: str = "analytics_queue"
+    rabbitmq_occupancy_exchange: str = "analytics_occupancy"
     
     # JWT
     jwt_secret: str = "7rTsLU4hJE0X80Wau2EYeBL6vp0pg1VWhy7mi7PvXuMozvUelbRFnpGA2yMq2t0A"
@@ -31,6 +35,46 @@ class Settings(BaseSettings):
     # Service
     service_port: int = 8000
     
+    # Consumer metrics
+    consumer_metrics_port: int = 9100
+    consumer_depth_sample_seconds: float = 5.0
+    
+    # Health checks
+    health_check_interval_seconds: float = 10.0
+    consumer_lag_threshold: int = 1000
+    
+    # Materialized views
+    materialized_views_enabled: bool = True
+    mv_refresh_interval_seconds: float = 60.0
+    mv_refresh_event_threshold: int = 50
+    
+    # Local analytical replica
+    analytics_replica_enabled: bool = False
+    analytics_replica_path: str = "data/analytics_replica.db"
+    
+    # Tracing
+    tracing_enabled: bool = False
+    tracing_sample_ratio: float = 0.1
+    tracing_exporter: str = "console"
+    tracing_file_path: str = "logs/traces.jsonl"
+    
+    # Request deadlines and cancellation
+    request_deadline_header: str = "X-Request-Timeout"
+    occupancy_deadline_seconds: float = 30.0
+    hotel_deadline_seconds: float = 10.0
+    disconnect_poll_seconds: float = 0.25
+    cancel_grace_seconds: float = 2.0
+    
+    # Multi-worker deployment
+    shared_cache_enabled: bool = True
+    shared_cache_ttl_seconds: float = 5.0
+    shared_cache_path: str = "/dev/shm/analytics_occupancy.cache"
+    
+    # Live stream (SSE)
+    stream_queue_size: int = 16
+    stream_keepalive_seconds: float = 15.0
+    stream_debounce_seconds: float = 0.5
+    
     class Config:
         env_file = ".env"
         case_sensitive = False
@@ -0,0 +1,163 @@
+"""
+Métricas en vivo del consumidor: profundidad de cola, tiempos por evento y retraso
+"""
+import json
+import logging
+import threading
+import time
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Optional
+from app.config import get_settings
+from app.rabbitmq import PUBLISHED_AT_HEADER, RabbitMQClient
+
+settings = get_settings()
+logger = logging.getLogger(__name__)
+
+
+def published_at(properties, message: dict) -> Optional[float]:
+    """
+    Obtener la hora de publicación de un mensaje
+
+    Usa la cabecera x-published-at-ms, después la propiedad timestamp de AMQP
+    y por último el campo timestamp del cuerpo (mensajes de Laravel).
+    """
+    headers = getattr(properties, "headers", None) or {}
+    if PUBLISHED_AT_HEADER in headers:
+        return int(headers[PUBLISHED_AT_HEADER]) / 1000
+    if getattr(properties, "timestamp", None):
+        return float(properties.timestamp)
+    try:
+        return datetime.fromisoformat(message["timestamp"]).timestamp()
+    except (KeyError, TypeError, ValueError):
+        return None
+
+
+class EventStats:
+    """Acumulador de tiempos de procesamiento de un tipo de evento"""
+
+    __slots__ = ("count", "errors", "total_seconds", "max_seconds")
+
+    def __init__(self):
+        self.count = 0
+        self.errors = 0
+        self.total_seconds = 0.0
+        self.max_seconds = 0.0
+
+    def to_dict(self) -> dict:
+        return {
+            "count": self.count,
+            "errors": self.errors,
+            "avg_ms": round(self.total_seconds / self.count * 1000, 3) if self.count else 0.0,
+            "max_ms": round(self.max_seconds * 1000, 3)
+        }
+
+
+class ConsumerMetrics:
+    """Métricas del consumidor de analytics_queue"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._events = {}
+        self.started_at = time.time()
+        self.last_lag_seconds: Optional[float] = None
+        self.max_lag_seconds = 0.0
+        self.queue_depth: Optional[int] = None
+        self.consumers: Optional[int] = None
+        self.depth_sampled_at: Optional[float] = None
+        self._stop = threading.Event()
+
+    def observe(self, event_type: str, duration: float, published: Optional[float], ok: bool = True):
+        """
+        Registrar un mensaje procesado
+
+        Args:
+            event_type: Tipo de evento
+            duration: Segundos de procesamiento
+            published: Hora de publicación (epoch) si se conoce
+            ok: False si el procesamiento falló
+        """
+        with self._lock:
+            stats = self._events.get(event_type)
+            if stats is None:
+                stats = self._events[event_type] = EventStats()
+            stats.count += 1
+            stats.total_seconds += duration
+            stats.max_seconds = max(stats.max_seconds, duration)
+            if not ok:
+                stats.errors += 1
+
+            if published is not None:
+                lag = max(time.time() - published, 0.0)
+                self.last_lag_seconds = lag
+                self.max_lag_seconds = max(self.max_lag_seconds, lag)
+
+    def snapshot(self) -> dict:
+        """Estado actual de las métricas"""
+        with self._lock:
+            events = {name: stats.to_dict() for name, stats in self._events.items()}
+        processed = sum(e["count"] for e in events.values())
+        uptime = time.time() - self.started_at
+        return {
+            "uptime_seconds": round(uptime, 1),
+            "processed": processed,
+            "throughput_per_second": round(processed / uptime, 2) if uptime > 0 else 0.0,
+            "queue_depth": self.queue_depth,
+            "consumers": self.consumers,
+            "depth_sampled_at": self.depth_sampled_at,
+            "lag_seconds": round(self.last_lag_seconds, 3) if self.last_lag_seconds is not None else None,
+            "max_lag_seconds": round(self.max_lag_seconds, 3),
+            "events": events
+        }
+
+    def start_depth_sampler(self, interval: float):
+        """Consultar periódicamente la profundidad de la cola con una conexión propia"""
+        def _sample():
+            client = RabbitMQClient(max_retries=1, retry_delay=1, connection_attempts=1)
+            while not self._stop.is_set():
+                try:
+                    stats = client.get_queue_stats()
+                    self.queue_depth = stats["message_count"]
+                    self.consumers = stats["consumer_count"]
+                    self.depth_sampled_at = time.time()
+                except Exception as e:
+                    logger.warning(f"No se pudo obtener la profundidad de la cola: {e}")
+                    try:
+                        client.close()
+                    except Exception:
+                        pass
+                self._stop.wait(interval)
+
+        threading.Thread(target=_sample, name="queue-depth-sampler", daemon=True).start()
+
+    def serve(self, port: int) -> ThreadingHTTPServer:
+        """Exponer las métricas en JSON por HTTP (GET /metrics)"""
+        metrics = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.rstrip("/") != "/metrics":
+                    self.send_error(404)
+                    return
+                body = json.dumps(metrics.snapshot()).encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        server = ThreadingHTTPServer(("0.0.0.0", port), Handler)
+        threading.Thread(target=server.serve_forever, name="consumer-metrics", daemon=True).start()
+        logger.info(f"Métricas del consumidor en http://0.0.0.0:{port}/metrics")
+        return server
+
+    def stop(self):
+        """Detener el muestreo de la cola"""
+        self._stop.set()
+
+
+# Instancia global de métricas del consumidor
+consumer_metrics = ConsumerMetrics()
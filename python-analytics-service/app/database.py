@@ -8,11 +8,18 @@ from app.config import get_settings
 
 settings = get_settings()
 
-# URL de conexión a PostgreSQL
-DATABASE_URL = f"postgresql://{settings.db_user}:{settings.db_password}@{settings.db_host}:{settings.db_port}/{settings.db_name}"
+# URL de conexión a PostgreSQL (driver psycopg 3)
+DATABASE_URL = f"postgresql+psycopg://{settings.db_user}:{settings.db_password}@{settings.db_host}:{settings.db_port}/{settings.db_name}"
 
 # Motor de SQLAlchemy
-engine = create_engine(DATABASE_URL)
+engine = create_engine(
+    DATABASE_URL,
+    connect_args={
+        "connect_timeout": settings.db_connect_timeout,
+        # Preparar en el servidor las sentencias que se repiten este número de veces
+        "prepare_threshold": settings.db_prepare_threshold if settings.db_prepared_statements else None
+    }
+)
 
 # Sesión de base de datos
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
@@ -21,10 +28,16 @@ SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 Base = declarative_base()
 
 
+# Marca en Session.info: la sesión quedó en manos de un hilo que la cerrará él mismo
+SESSION_HANDED_OFF = "handed_off"
+
+
 def get_db():
     """Dependency para obtener sesión de base de datos"""
     db = SessionLocal()
     try:
         yield db
     finally:
-        db.close()
+        # Una sesión cedida puede seguir en uso en otro hilo: no se cierra desde aquí
+        if not db.info.get(SESSION_HANDED_OFF):
+            db.close()
@@ -0,0 +1,129 @@
+"""
+Verificación en segundo plano del estado de las dependencias
+"""
+import logging
+import threading
+import time
+from datetime import datetime
+from typing import Optional
+from sqlalchemy import text
+from app.config import get_settings
+from app.database import engine
+from app.rabbitmq import RabbitMQClient
+
+settings = get_settings()
+logger = logging.getLogger(__name__)
+
+
+class HealthMonitor:
+    """
+    Comprueba periódicamente PostgreSQL, RabbitMQ y el retraso del consumidor
+
+    Los resultados se guardan en memoria para que las sondas de readiness
+    respondan sin tocar las dependencias en la ruta de la petición.
+    """
+
+    def __init__(self, interval: float, lag_threshold: int):
+        self.interval = interval
+        self.lag_threshold = lag_threshold
+        self._rabbitmq = RabbitMQClient(max_retries=1, retry_delay=1, connection_attempts=1)
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._status = {
+            "database": {"status": "unknown"},
+            "rabbitmq": {"status": "unknown"},
+            "consumer": {"status": "unknown"},
+            "checked_at": None
+        }
+
+    def start(self):
+        """Iniciar el hilo de verificación"""
+        if self._thread and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="health-monitor", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """Detener el hilo de verificación"""
+        self._stop.set()
+
+    def _run(self):
+        """Bucle de verificación periódica"""
+        while not self._stop.is_set():
+            self.check()
+            self._stop.wait(self.interval)
+
+    def check(self):
+        """Ejecutar una ronda de comprobaciones y actualizar el estado en caché"""
+        database = self._check_database()
+        rabbitmq, consumer = self._check_rabbitmq()
+        self._status = {
+            "database": database,
+            "rabbitmq": rabbitmq,
+            "consumer": consumer,
+            "checked_at": datetime.now().isoformat()
+        }
+
+    def _check_database(self) -> dict:
+        """Comprobar PostgreSQL con una consulta trivial"""
+        start = time.perf_counter()
+        try:
+            with engine.connect() as conn:
+                conn.execute(text("SELECT 1"))
+            return {"status": "up", "latency_ms": round((time.perf_counter() - start) * 1000, 2)}
+        except Exception as e:
+            logger.warning(f"Health check de base de datos fallido: {e}")
+            return {"status": "down", "error": str(e)}
+
+    def _check_rabbitmq(self) -> tuple:
+        """Comprobar RabbitMQ y obtener la profundidad de la cola de analytics"""
+        start = time.perf_counter()
+        try:
+            stats = self._rabbitmq.get_queue_stats()
+        except Exception as e:
+            logger.warning(f"Health check de RabbitMQ fallido: {e}")
+            try:
+                self._rabbitmq.close()
+            except Exception:
+                pass
+            return {"status": "down", "error": str(e)}, {"status": "unknown"}
+
+        rabbitmq = {"status": "up", "latency_ms": round((time.perf_counter() - start) * 1000, 2)}
+
+        if stats["consumer_count"] == 0:
+            consumer_status = "down"
+        elif stats["message_count"] > self.lag_threshold:
+            consumer_status = "lagging"
+        else:
+            consumer_status = "up"
+
+        consumer = {
+            "status": consumer_status,
+            "queue_depth": stats["message_count"],
+            "consumers": stats["consumer_count"],
+            "lag_threshold": self.lag_threshold
+        }
+        return rabbitmq, consumer
+
+    @property
+    def status(self) -> dict:
+        """Último estado conocido de las dependencias"""
+        return self._status
+
+    @property
+    def is_ready(self) -> bool:
+        """
+        El servicio está listo si la base de datos responde
+
+        RabbitMQ y el consumidor solo degradan el estado: las estadísticas
+        se pueden servir aunque la publicación de eventos falle.
+        """
+        return self._status["database"]["status"] == "up"
+
+
+# Instancia global del monitor
+health_monitor = HealthMonitor(
+    interval=settings.health_check_interval_seconds,
+    lag_threshold=settings.consumer_lag_threshold
+)
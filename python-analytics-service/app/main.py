@@ -1,15 +1,24 @@
 """
 API Principal del servicio de Analytics
 """
-from fastapi import FastAPI, Depends, HTTPException
+from fastapi import FastAPI, Depends, HTTPException, Request
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse, StreamingResponse
 from sqlalchemy.orm import Session
-from app.database import get_db
+from app.database import get_db, engine
 from app.schemas import OccupancyResponse, ErrorResponse
 from app.services.analytics_service import AnalyticsService
+from app.services.occupancy_feed import OccupancyFeed
 from app.rabbitmq import rabbitmq_client
+from app.broadcaster import occupancy_broadcaster
+from app.health import health_monitor
+from app.materialized_views import mv_scheduler
+from app.shared_cache import stats_cache
+from app.cancellation import cancellation_metrics, run_cancellable
 from app.config import get_settings
 from app.auth import get_current_user, require_admin
+from app.tracing import TracingMiddleware, setup_tracing
+import asyncio
 import logging
 from datetime import datetime
 
@@ -23,6 +32,16 @@ logger = logging.getLogger(__name__)
 # Configuración
 settings = get_settings()
 
+# Trazas distribuidas (no-op si TRACING_ENABLED=false)
+tracing_enabled = setup_tracing("analytics-service", engine)
+
+# Listener de eventos que alimenta el feed SSE
+occupancy_feed = OccupancyFeed(
+    occupancy_broadcaster,
+    debounce=settings.stream_debounce_seconds,
+    on_event=mv_scheduler.note_event if settings.materialized_views_enabled else None
+)
+
 # Crear aplicación FastAPI
 app = FastAPI(
     title="Analytics Service",
@@ -40,22 +59,38 @@ app.add_middleware(
 )
 
 
+# Span por petición HTTP (middleware ASGI puro para no ocultar las desconexiones)
+if tracing_enabled:
+    app.add_middleware(TracingMiddleware)
+
+
 @app.on_event("startup")
 async def startup_event():
     """Evento al iniciar la aplicación"""
     logger.info("Iniciando servicio de Analytics...")
-    try:
-        # Conectar a RabbitMQ
-        rabbitmq_client.connect()
-        logger.info("Conexión a RabbitMQ establecida")
-    except Exception as e:
-        logger.error(f"Error al conectar con RabbitMQ: {e}", exc_info=True)
+    
+    # Conectar a RabbitMQ en segundo plano para no retrasar el arranque
+    rabbitmq_client.connect_in_background()
+    
+    # Comprobaciones periódicas de dependencias para las sondas de readiness
+    health_monitor.start()
+    
+    # Iniciar feed de ocupación en vivo
+    occupancy_broadcaster.bind_loop(asyncio.get_running_loop())
+    occupancy_feed.start()
+    
+    # Refresco programado de las vistas materializadas (innecesario si se usa la réplica local)
+    if settings.materialized_views_enabled and not settings.analytics_replica_enabled:
+        mv_scheduler.start()
 
 
 @app.on_event("shutdown")
 async def shutdown_event():
     """Evento al cerrar la aplicación"""
     logger.info("Cerrando servicio de Analytics...")
+    occupancy_feed.stop()
+    health_monitor.stop()
+    mv_scheduler.stop()
     rabbitmq_client.close()
 
 
@@ -71,14 +106,56 @@ async def root():
 
 
 @app.get("/health", tags=["Health"])
+@app.get("/health/live", tags=["Health"])
 async def health_check():
-    """Endpoint de health check"""
+    """Liveness: el proceso está vivo y atiende peticiones (no consulta dependencias)"""
     return {
         "status": "healthy",
         "timestamp": datetime.now().isoformat()
     }
 
 
+@app.get("/health/ready", tags=["Health"])
+async def readiness_check():
+    """
+    Readiness: estado en caché de PostgreSQL, RabbitMQ y retraso del consumidor
+    
+    El estado lo actualiza un hilo en segundo plano, por lo que la sonda
+    nunca consulta las dependencias en la ruta de la petición.
+    Devuelve 503 mientras la base de datos no esté disponible.
+    """
+    dependencies = health_monitor.status
+    ready = health_monitor.is_ready
+    degraded = any(
+        dependencies[name]["status"] != "up"
+        for name in ("rabbitmq", "consumer")
+    )
+    
+    return JSONResponse(
+        status_code=200 if ready else 503,
+        content={
+            "status": ("degraded" if degraded else "ready") if ready else "not_ready",
+            "dependencies": dependencies,
+            "timestamp": datetime.now().isoformat()
+        }
+    )
+
+
+@app.get("/metrics", tags=["Health"])
+async def metrics():
+    """
+    Consultas canceladas por desconexión o plazo y segundos de BD ahorrados
+
+    Suma las cifras de todos los workers a través de la caché compartida.
+    Con SHARED_CACHE_ENABLED=false solo refleja el worker que responde
+    (`scope: "worker"`).
+    """
+    return {
+        "cancellation": cancellation_metrics.snapshot(),
+        "timestamp": datetime.now().isoformat()
+    }
+
+
 @app.get(
     "/analytics/occupancy",
     response_model=OccupancyResponse,
@@ -89,6 +166,7 @@ async def health_check():
     tags=["Analytics"]
 )
 async def get_occupancy_statistics(
+    request: Request,
     db: Session = Depends(get_db),
     current_user: dict = Depends(require_admin)
 ):
@@ -109,6 +187,9 @@ async def get_occupancy_statistics(
     
     **Actores:** Admin, Servicio Python (Analytics)
     
+    Las consultas se cancelan si el cliente se desconecta o vence el plazo
+    (`OCCUPANCY_DEADLINE_SECONDS` o la cabecera `X-Request-Timeout`).
+    
     Returns:
         OccupancyResponse con las estadísticas de ocupación
     """
@@ -117,31 +198,45 @@ async def get_occupancy_statistics(
         
         # Generar estadísticas
         analytics_service = AnalyticsService()
-        stats = analytics_service.get_occupancy_statistics(db)
+        if settings.shared_cache_enabled:
+            # Un solo worker recalcula; el resto sirve el último resultado compartido
+            compute = lambda: stats_cache.get_or_compute(lambda: analytics_service.get_occupancy_report(db))
+        else:
+            compute = lambda: analytics_service.get_occupancy_report(db)
+        stats, freshness = await run_cancellable(
+            request, db, compute, "occupancy", settings.occupancy_deadline_seconds
+        )
         
-        # Publicar evento en RabbitMQ
-        try:
-            message = {
-                "event": "occupancy_stats_generated",
-                "timestamp": datetime.now().isoformat(),
-                "data": {
-                    "total_reservations": stats.total_reservations,
-                    "active_reservations": stats.active_reservations,
-                    "occupancy_rate": stats.occupancy_rate
+        # Publicar evento en RabbitMQ (sin esperar a reconectar en la ruta de la petición)
+        if not rabbitmq_client.is_connected:
+            logger.warning("RabbitMQ no disponible, se omite la publicación del evento")
+            rabbitmq_client.connect_in_background()
+        else:
+            try:
+                message = {
+                    "event": "occupancy_stats_generated",
+                    "timestamp": datetime.now().isoformat(),
+                    "data": {
+                        "total_reservations": stats.total_reservations,
+                        "active_reservations": stats.active_reservations,
+                        "occupancy_rate": stats.occupancy_rate
+                    }
                 }
-            }
-            rabbitmq_client.publish_message(message)
-        except Exception as e:
-            logger.warning(f"No se pudo publicar en RabbitMQ: {e}")
+                rabbitmq_client.publish_message(message, retry=False)
+            except Exception as e:
+                logger.warning(f"No se pudo publicar en RabbitMQ: {e}")
         
         logger.info("Estadísticas generadas exitosamente")
         
         return OccupancyResponse(
             success=True,
             message="Estadísticas de ocupación obtenidas exitosamente",
-            data=stats
+            data=stats,
+            freshness=freshness
         )
         
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Error al obtener estadísticas: {e}", exc_info=True)
         raise HTTPException(
@@ -155,9 +250,44 @@ async def get_occupancy_statistics(
         )
 
 
+@app.get("/analytics/occupancy/stream", tags=["Analytics"])
+async def stream_occupancy(
+    request: Request,
+    current_user: dict = Depends(require_admin)
+):
+    """
+    Feed en vivo de ocupación por hotel vía Server-Sent Events (requiere autenticación de admin)
+    
+    Envía el último estado conocido al conectar y después un evento `occupancy`
+    cada vez que llegan eventos reservation_* a la cola de analytics. Los clientes
+    que no consumen a tiempo se desconectan para no acumular memoria.
+    
+    **Requiere:** Token JWT válido con rol de admin
+    
+    Returns:
+        StreamingResponse con media type text/event-stream
+    """
+    logger.info(f"Usuario {current_user.get('email')} suscrito al feed de ocupación")
+    subscriber = occupancy_broadcaster.subscribe()
+    
+    return StreamingResponse(
+        occupancy_broadcaster.stream(
+            subscriber,
+            request.is_disconnected,
+            keepalive=settings.stream_keepalive_seconds
+        ),
+        media_type="text/event-stream",
+        headers={
+            "Cache-Control": "no-cache",
+            "X-Accel-Buffering": "no"
+        }
+    )
+
+
 @app.get("/analytics/occupancy/hotel/{hotel_id}", tags=["Analytics"])
 async def get_hotel_occupancy(
     hotel_id: int,
+    request: Request,
     db: Session = Depends(get_db),
     current_user: dict = Depends(require_admin)
 ):
@@ -175,28 +305,18 @@ async def get_hotel_occupancy(
     try:
         logger.info(f"Usuario {current_user.get('email')} consulta hotel {hotel_id}")
         
-        from sqlalchemy import func, case
-        from app.models import Reservation
-        
-        # Consultar reservas del hotel (convertir hotel_id a string para comparación)
-        total = db.query(func.count(Reservation.id))\
-            .filter(Reservation.hotel_id == str(hotel_id)).scalar() or 0
-        
-        active = db.query(func.count(Reservation.id))\
-            .filter(Reservation.hotel_id == str(hotel_id))\
-            .filter(Reservation.status == 'confirmed').scalar() or 0
-        
-        occupancy_rate = round((active / total * 100), 2) if total > 0 else 0
+        data, freshness = await run_cancellable(
+            request, db, lambda: AnalyticsService.get_hotel_report(db, hotel_id),
+            "hotel", settings.hotel_deadline_seconds
+        )
         
         return {
             "success": True,
-            "data": {
-                "hotel_id": hotel_id,
-                "total_reservations": total,
-                "active_reservations": active,
-                "occupancy_rate": occupancy_rate
-            }
+            "data": data,
+            "freshness": freshness
         }
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Error al obtener estadísticas del hotel: {e}", exc_info=True)
         raise HTTPException(status_code=500, detail=str(e))
@@ -0,0 +1,290 @@
+"""
+Vistas materializadas de agregados de ocupación y su refresco programado
+"""
+import logging
+import threading
+import time
+from typing import Optional
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+from app.config import get_settings
+from app.database import engine
+from app.queries import execute_pipelined
+
+settings = get_settings()
+logger = logging.getLogger(__name__)
+
+# Clave del advisory lock que garantiza un único refresco entre réplicas
+ADVISORY_LOCK_KEY = 74_201_028
+
+REFRESH_LOG_TABLE = "analytics_mv_refresh_log"
+
+# Nombre de la vista -> (consulta, columna del índice único requerido por CONCURRENTLY)
+VIEWS = {
+    "analytics_mv_by_hotel": (
+        """
+        SELECT hotel_id,
+               COUNT(id) AS count,
+               COUNT(CASE WHEN status = 'confirmed' THEN 1 END) AS active
+        FROM reservations
+        GROUP BY hotel_id
+        """,
+        "hotel_id"
+    ),
+    "analytics_mv_by_room_type": (
+        """
+        SELECT room_type,
+               COUNT(id) AS count,
+               COUNT(CASE WHEN status = 'confirmed' THEN 1 END) AS active
+        FROM reservations
+        GROUP BY room_type
+        """,
+        "room_type"
+    ),
+    "analytics_mv_by_status": (
+        """
+        SELECT status,
+               COUNT(id) AS count
+        FROM reservations
+        GROUP BY status
+        """,
+        "status"
+    ),
+}
+
+
+def _try_lock(conn) -> bool:
+    """Intentar tomar el advisory lock de la transacción actual"""
+    return bool(conn.execute(
+        text("SELECT pg_try_advisory_xact_lock(:key)"),
+        {"key": ADVISORY_LOCK_KEY}
+    ).scalar())
+
+
+def create_views() -> bool:
+    """
+    Crear las vistas materializadas y la tabla de registro si no existen
+
+    Returns:
+        bool: False si otra réplica tiene el lock y no se hizo nada
+    """
+    with engine.begin() as conn:
+        if not _try_lock(conn):
+            return False
+
+        conn.execute(text(f"""
+            CREATE TABLE IF NOT EXISTS {REFRESH_LOG_TABLE} (
+                id SMALLINT PRIMARY KEY DEFAULT 1,
+                refreshed_at TIMESTAMPTZ NOT NULL,
+                duration_ms DOUBLE PRECISION NOT NULL
+            )
+        """))
+        for name, (query, unique_column) in VIEWS.items():
+            conn.execute(text(f"CREATE MATERIALIZED VIEW IF NOT EXISTS {name} AS {query} WITH DATA"))
+            conn.execute(text(
+                f"CREATE UNIQUE INDEX IF NOT EXISTS {name}_uidx ON {name} ({unique_column})"
+            ))
+        # Solo la primera creación registra una fecha; las vistas existentes conservan la suya
+        conn.execute(text(f"""
+            INSERT INTO {REFRESH_LOG_TABLE} (id, refreshed_at, duration_ms)
+            VALUES (1, now(), 0)
+            ON CONFLICT (id) DO NOTHING
+        """))
+
+    logger.info("Vistas materializadas de ocupación verificadas")
+    return True
+
+
+def refresh_views(max_age: Optional[float] = None) -> Optional[float]:
+    """
+    Refrescar todas las vistas con REFRESH MATERIALIZED VIEW CONCURRENTLY
+
+    El advisory lock evita refrescos simultáneos; además, tras tomarlo se
+    consulta el registro y se omite el refresco si otra réplica ya lo hizo
+    hace menos de max_age segundos. Así las réplicas, que despiertan cada
+    una con su propia fase, no repiten el trabajo en cada intervalo.
+
+    Args:
+        max_age: Antigüedad máxima aceptable del último refresco (None para forzarlo)
+
+    Returns:
+        Antigüedad en segundos de las vistas tras la llamada (0.0 si se
+        refrescaron ahora) o None si otra réplica tenía el lock
+    """
+    with engine.begin() as conn:
+        if not _try_lock(conn):
+            logger.info("Otra réplica está refrescando las vistas, se omite")
+            return None
+
+        if max_age is not None:
+            age = conn.execute(READ_AGE).scalar()
+            if age is not None and float(age) < max_age:
+                logger.debug(f"Vistas refrescadas hace {float(age):.1f}s por otra réplica, se omite")
+                return float(age)
+
+        start = time.perf_counter()
+        for name in VIEWS:
+            conn.execute(text(f"REFRESH MATERIALIZED VIEW CONCURRENTLY {name}"))
+        duration_ms = (time.perf_counter() - start) * 1000
+        _record_refresh(conn, duration_ms=duration_ms)
+
+    logger.info(f"Vistas materializadas refrescadas en {duration_ms:.1f} ms")
+    return 0.0
+
+
+def _record_refresh(conn, duration_ms: float):
+    """Registrar la hora del último refresco (visible para todas las réplicas)"""
+    conn.execute(text(f"""
+        INSERT INTO {REFRESH_LOG_TABLE} (id, refreshed_at, duration_ms)
+        VALUES (1, now(), :duration_ms)
+        ON CONFLICT (id) DO UPDATE
+        SET refreshed_at = EXCLUDED.refreshed_at, duration_ms = EXCLUDED.duration_ms
+    """), {"duration_ms": duration_ms})
+
+
+# Segundos desde el último refresco según el reloj de PostgreSQL
+READ_AGE = text(f"SELECT EXTRACT(EPOCH FROM now() - refreshed_at) FROM {REFRESH_LOG_TABLE} WHERE id = 1")
+
+# Lecturas de las vistas (definidas una vez para prepararse en el servidor)
+READ_FRESHNESS = text(f"""
+    SELECT refreshed_at, EXTRACT(EPOCH FROM now() - refreshed_at) AS staleness
+    FROM {REFRESH_LOG_TABLE}
+    WHERE id = 1
+""")
+READ_BY_HOTEL = text("SELECT hotel_id, count, active FROM analytics_mv_by_hotel")
+READ_BY_ROOM_TYPE = text("SELECT room_type, count, active FROM analytics_mv_by_room_type")
+READ_BY_STATUS = text("SELECT status, count FROM analytics_mv_by_status")
+READ_HOTEL = text(f"""
+    SELECT v.count, v.active, l.refreshed_at,
+           EXTRACT(EPOCH FROM now() - l.refreshed_at) AS staleness
+    FROM {REFRESH_LOG_TABLE} l
+    LEFT JOIN analytics_mv_by_hotel v ON v.hotel_id = :hotel_id
+    WHERE l.id = 1
+""")
+
+
+def fetch_breakdowns(db: Session) -> dict:
+    """
+    Leer los agregados desde las vistas materializadas (en un solo pipeline)
+
+    Args:
+        db: Sesión de base de datos
+
+    Returns:
+        dict con by_hotel, by_room_type, by_status, refreshed_at y staleness_seconds
+
+    Raises:
+        sqlalchemy.exc.DBAPIError: Si las vistas no existen
+    """
+    freshness, by_hotel, by_room_type, by_status = execute_pipelined(db, [
+        (READ_FRESHNESS, {}),
+        (READ_BY_HOTEL, {}),
+        (READ_BY_ROOM_TYPE, {}),
+        (READ_BY_STATUS, {})
+    ])
+    freshness = freshness[0] if freshness else None
+
+    return {
+        "by_hotel": by_hotel,
+        "by_room_type": by_room_type,
+        "by_status": by_status,
+        "refreshed_at": freshness.refreshed_at if freshness else None,
+        "staleness_seconds": round(float(freshness.staleness), 3) if freshness else None
+    }
+
+
+def fetch_hotel(db: Session, hotel_id: str) -> Optional[dict]:
+    """
+    Leer los agregados de un hotel desde la vista materializada
+
+    Args:
+        db: Sesión de base de datos
+        hotel_id: ID del hotel
+
+    Returns:
+        dict con count, active, refreshed_at y staleness_seconds
+    """
+    rows, = execute_pipelined(db, [(READ_HOTEL, {"hotel_id": hotel_id})])
+
+    if not rows:
+        return None
+    row = rows[0]
+    return {
+        "count": row.count or 0,
+        "active": row.active or 0,
+        "refreshed_at": row.refreshed_at,
+        "staleness_seconds": round(float(row.staleness), 3)
+    }
+
+
+class MaterializedViewScheduler:
+    """
+    Refresca las vistas cada cierto intervalo o antes si llegan suficientes eventos
+
+    Todas las réplicas (y todos los workers) ejecutan el scheduler. El
+    advisory lock evita refrescos simultáneos y el registro de refrescos
+    hace que una réplica omita la ronda si otra ya refrescó a tiempo.
+    """
+
+    def __init__(self, interval: float, event_threshold: int):
+        self.interval = interval
+        self.event_threshold = event_threshold
+        self._events = 0
+        self._threshold_at: Optional[float] = None
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._views_ready = False
+
+    def start(self):
+        """Iniciar el hilo del scheduler"""
+        if self._thread and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="mv-scheduler", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """Detener el scheduler"""
+        self._stop.set()
+        self._wake.set()
+
+    def note_event(self):
+        """Contabilizar un evento de reserva; adelanta el refresco al llegar al umbral"""
+        self._events += 1
+        if self._events >= self.event_threshold:
+            if self._threshold_at is None:
+                self._threshold_at = time.monotonic()
+            self._wake.set()
+
+    def _run(self):
+        """Bucle del scheduler"""
+        while not self._stop.is_set():
+            wait = self.interval
+            try:
+                if not self._views_ready:
+                    self._views_ready = create_views()
+                else:
+                    threshold_at, self._threshold_at = self._threshold_at, None
+                    self._events = 0
+                    if threshold_at is not None:
+                        # Basta un refresco que empezara después de alcanzar el umbral
+                        max_age = time.monotonic() - threshold_at
+                    else:
+                        max_age = self.interval
+                    age = refresh_views(max_age=max_age)
+                    if age is not None:
+                        # Despertar cuando venza el refresco hecho por la réplica que lo ejecutó
+                        wait = max(self.interval - age, 1.0)
+            except Exception as e:
+                logger.error(f"Error al refrescar vistas materializadas: {e}")
+
+            self._wake.wait(wait)
+            self._wake.clear()
+
+
+# Instancia global del scheduler
+mv_scheduler = MaterializedViewScheduler(
+    interval=settings.mv_refresh_interval_seconds,
+    event_threshold=settings.mv_refresh_event_threshold
+)
@@ -0,0 +1,110 @@
+"""
+Consultas analíticas frecuentes como sentencias Core preparadas y en pipeline
+"""
+from typing import List, Sequence, Tuple
+import psycopg
+from opentelemetry.trace import SpanKind, Status, StatusCode
+from psycopg.rows import namedtuple_row
+from sqlalchemy import bindparam, case, func, select
+from sqlalchemy.engine import Compiled
+from sqlalchemy.exc import DBAPIError
+from sqlalchemy.orm import Session
+from sqlalchemy.sql import ClauseElement
+from app.cancellation import check_cancelled
+from app.config import get_settings
+from app.database import engine
+from app.models import Reservation
+from app.tracing import start_statement_span, tracer
+
+settings = get_settings()
+
+reservations = Reservation.__table__
+
+_active = func.count(case((reservations.c.status == 'confirmed', 1)))
+
+# Sentencias definidas una sola vez: misma clave de caché en cada petición
+STATUS_COUNTS = (
+    select(reservations.c.status, func.count(reservations.c.id).label('count'))
+    .group_by(reservations.c.status)
+)
+
+HOTEL_COUNTS = (
+    select(reservations.c.hotel_id, func.count(reservations.c.id).label('count'), _active.label('active'))
+    .group_by(reservations.c.hotel_id)
+)
+
+ROOM_TYPE_COUNTS = (
+    select(reservations.c.room_type, func.count(reservations.c.id).label('count'), _active.label('active'))
+    .group_by(reservations.c.room_type)
+)
+
+HOTEL_TOTALS = (
+    select(func.count(reservations.c.id).label('count'), _active.label('active'))
+    .where(reservations.c.hotel_id == bindparam('hotel_id'))
+)
+
+# Sentencias compiladas por id (se compilan una vez por proceso)
+_compiled = {}
+
+
+def _compile(statement: ClauseElement) -> Compiled:
+    """Compilar una sentencia para el dialecto del motor y guardarla en caché"""
+    entry = _compiled.get(id(statement))
+    if entry is None:
+        entry = _compiled[id(statement)] = (statement, statement.compile(dialect=engine.dialect))
+    return entry[1]
+
+
+def execute_pipelined(db: Session, statements: Sequence[Tuple[ClauseElement, dict]]) -> List[list]:
+    """
+    Ejecutar sentencias independientes en un solo viaje de red
+
+    Con psycopg 3 las sentencias se envían en modo pipeline y como
+    sentencias preparadas del servidor (DB_PREPARED_STATEMENTS), de modo que
+    PostgreSQL no vuelve a analizarlas ni planificarlas en cada petición.
+    Con otros drivers se ejecutan de forma secuencial.
+
+    Args:
+        db: Sesión de base de datos
+        statements: Lista de (sentencia, parámetros)
+
+    Returns:
+        Lista con las filas de cada sentencia, en el mismo orden
+    """
+    check_cancelled(db)
+    driver_conn = db.connection().connection.driver_connection
+
+    if not hasattr(driver_conn, "pipeline"):
+        return [db.execute(stmt, params).all() for stmt, params in statements]
+
+    with tracer.start_as_current_span(
+        "db pipeline",
+        kind=SpanKind.CLIENT,
+        attributes={"db.system": "postgresql", "db.statement_count": len(statements)}
+    ):
+        cursors = []
+        # Un span hijo por sentencia: comparten el viaje de red del pipeline
+        statement_spans = []
+        try:
+            with driver_conn.pipeline():
+                for stmt, params in statements:
+                    compiled = _compile(stmt)
+                    statement_spans.append(start_statement_span(compiled.string))
+                    cursor = driver_conn.cursor(row_factory=namedtuple_row)
+                    # construct_params incluye los literales enlazados ('confirmed') y los del llamador
+                    cursor.execute(compiled.string, compiled.construct_params(params),
+                                   prepare=settings.db_prepared_statements)
+                    cursors.append(cursor)
+            # Al salir del bloque pipeline todos los resultados ya están disponibles
+            return [cursor.fetchall() for cursor in cursors]
+        except psycopg.Error as e:
+            for span in statement_spans:
+                span.record_exception(e)
+                span.set_status(Status(StatusCode.ERROR))
+            # Una sentencia cancelada por la petición no debe activar los fallbacks
+            check_cancelled(db)
+            # Mismo tipo de excepción que lanzaría SQLAlchemy con db.execute()
+            raise DBAPIError.instance(None, None, e, psycopg.Error) from e
+        finally:
+            for span in statement_spans:
+                span.end()
@@ -3,22 +3,42 @@ Configuración y utilidades de RabbitMQ
 """
 import pika
 import json
+from opentelemetry.trace import SpanKind
 import logging
+import threading
 import time
 from app.config import get_settings
+from app.tracing import tracer, inject_headers
 
 settings = get_settings()
 logger = logging.getLogger(__name__)
 
+# Cabecera AMQP con la hora de publicación en milisegundos desde epoch
+# (las tablas de cabeceras de pika no admiten floats)
+PUBLISHED_AT_HEADER = "x-published-at-ms"
+
 
 class RabbitMQClient:
     """Cliente de RabbitMQ para publicar y consumir mensajes con reintentos automáticos"""
     
-    def __init__(self, max_retries=3, retry_delay=2):
+    def __init__(self, max_retries=3, retry_delay=2, connection_attempts=3):
         self.connection = None
         self.channel = None
         self.max_retries = max_retries
         self.retry_delay = retry_delay
+        self.connection_attempts = connection_attempts
+        self._connect_thread = None
+        # Exchanges ya declarados en el canal actual
+        self._declared_channel = None
+        self._declared_exchanges = set()
+        
+    @property
+    def is_connected(self) -> bool:
+        """Indica si hay una conexión y un canal abiertos"""
+        return bool(
+            self.connection and self.connection.is_open
+            and self.channel and self.channel.is_open
+        )
         
     def connect(self):
         """Establecer conexión con RabbitMQ con reintentos"""
@@ -34,8 +54,8 @@ class RabbitMQClient:
                     credentials=credentials,
                     heartbeat=600,
                     blocked_connection_timeout=300,
-                    connection_attempts=3,
-                    retry_delay=2
+                    connection_attempts=self.connection_attempts,
+                    retry_delay=self.retry_delay
                 )
                 self.connection = pika.BlockingConnection(parameters)
                 self.channel = self.connection.channel()
@@ -51,6 +71,41 @@ class RabbitMQClient:
                     raise
         return False
     
+    def connect_in_background(self):
+        """
+        Conectar en un hilo aparte sin bloquear al llamador
+        
+        Si ya hay un intento en curso no se lanza otro.
+        """
+        if self._connect_thread and self._connect_thread.is_alive():
+            return
+        
+        def _connect():
+            try:
+                self.connect()
+            except Exception as e:
+                logger.error(f"Error al conectar con RabbitMQ en segundo plano: {e}")
+        
+        self._connect_thread = threading.Thread(target=_connect, name="rabbitmq-connect", daemon=True)
+        self._connect_thread.start()
+    
+    def get_queue_stats(self, queue: str = None) -> dict:
+        """
+        Obtener profundidad de la cola y número de consumidores
+        
+        Args:
+            queue: Nombre de la cola (por defecto la cola de analytics)
+            
+        Returns:
+            dict: message_count y consumer_count
+        """
+        self._ensure_connection()
+        result = self.channel.queue_declare(queue=queue or settings.rabbitmq_queue, passive=True)
+        return {
+            "message_count": result.method.message_count,
+            "consumer_count": result.method.consumer_count
+        }
+    
     def _ensure_connection(self):
         """Asegurar que la conexión está activa, reconectar si es necesario"""
         if not self.connection or self.connection.is_closed:
@@ -66,15 +121,26 @@ class RabbitMQClient:
             try:
                 self._ensure_connection()
                 
-                self.channel.basic_publish(
-                    exchange='',
-                    routing_key=settings.rabbitmq_queue,
-                    body=json.dumps(message),
-                    properties=pika.BasicProperties(
-                        delivery_mode=2,  # Hacer mensaje persistente
-                        content_type='application/json'
+                with tracer.start_as_current_span(
+                    f"{settings.rabbitmq_queue} publish",
+                    kind=SpanKind.PRODUCER,
+                    attributes={
+                        "messaging.system": "rabbitmq",
+                        "messaging.destination.name": settings.rabbitmq_queue,
+                        "messaging.event": message.get('event', 'unknown')
+                    }
+                ):
+                    self.channel.basic_publish(
+                        exchange='',
+                        routing_key=settings.rabbitmq_queue,
+                        body=json.dumps(message),
+                        properties=pika.BasicProperties(
+                            delivery_mode=2,  # Hacer mensaje persistente
+                            content_type='application/json',
+                            # Hora de publicación (para medir el retraso) y contexto de traza
+                            headers=inject_headers({PUBLISHED_AT_HEADER: int(time.time() * 1000)})
+                        )
                     )
-                )
                 logger.info(f"✓ Mensaje publicado exitosamente: {message.get('event', 'unknown')}")
                 return True
             except Exception as e:
@@ -90,6 +156,50 @@ class RabbitMQClient:
                     raise
         return False
     
+    def _declare_fanout(self, exchange: str):
+        """Declarar un exchange fanout una sola vez por canal"""
+        if self._declared_channel is not self.channel:
+            self._declared_channel = self.channel
+            self._declared_exchanges = set()
+        if exchange not in self._declared_exchanges:
+            self.channel.exchange_declare(exchange=exchange, exchange_type='fanout', durable=True)
+            self._declared_exchanges.add(exchange)
+    
+    def publish_to_exchange(self, exchange: str, message: dict):
+        """Publicar una notificación efímera en un exchange fanout"""
+        self._ensure_connection()
+        self._declare_fanout(exchange)
+        with tracer.start_as_current_span(
+            f"{exchange} publish",
+            kind=SpanKind.PRODUCER,
+            attributes={"messaging.system": "rabbitmq", "messaging.destination.name": exchange}
+        ):
+            self.channel.basic_publish(
+                exchange=exchange,
+                routing_key='',
+                body=json.dumps(message),
+                properties=pika.BasicProperties(
+                    content_type='application/json',
+                    headers=inject_headers()
+                )
+            )
+
+    def bind_fanout(self, exchange: str, callback):
+        """
+        Suscribirse a un exchange fanout con una cola exclusiva
+
+        Cada proceso suscrito recibe su propia copia de los mensajes,
+        sin competir con el consumidor de la cola principal.
+        """
+        self._ensure_connection()
+        self._declare_fanout(exchange)
+        result = self.channel.queue_declare(queue='', exclusive=True, auto_delete=True)
+        queue_name = result.method.queue
+        self.channel.queue_bind(exchange=exchange, queue=queue_name)
+        self.channel.basic_consume(queue=queue_name, on_message_callback=callback, auto_ack=True)
+        logger.info(f"Suscrito al exchange {exchange}")
+        return queue_name
+
     def consume_messages(self, callback):
         """Consumir mensajes de la cola"""
         try:
@@ -107,6 +217,18 @@ class RabbitMQClient:
             logger.error(f"Error al consumir mensajes: {e}")
             raise
     
+    def reset_after_fork(self):
+        """
+        Olvidar la conexión heredada del proceso padre tras un fork
+
+        El socket AMQP no puede compartirse entre procesos: cerrarlo desde el
+        hijo cerraría también la conexión del padre, así que solo se descarta
+        y cada worker abre la suya.
+        """
+        self.connection = None
+        self.channel = None
+        self._connect_thread = None
+    
     def close(self):
         """Cerrar conexión"""
         if self.connection and not self.connection.is_closed:
@@ -0,0 +1,361 @@
+"""
+Réplica analítica local (SQLite en modo WAL) alimentada por eventos de reservas
+"""
+import logging
+import os
+import sqlite3
+from collections import namedtuple
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+from typing import Iterator, Optional
+from sqlalchemy.orm import Session
+from app.config import get_settings
+from app.models import Reservation
+
+settings = get_settings()
+logger = logging.getLogger(__name__)
+
+# Margen hacia atrás al ponerse al día, para cubrir relojes y transacciones largas
+CATCH_UP_MARGIN = timedelta(minutes=5)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS reservations (
+    id INTEGER PRIMARY KEY,
+    hotel_id TEXT,
+    room_type TEXT,
+    status TEXT,
+    check_in TEXT,
+    check_out TEXT,
+    updated_at TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_reservations_hotel ON reservations (hotel_id, status);
+CREATE TABLE IF NOT EXISTS replication_state (
+    key TEXT PRIMARY KEY,
+    value TEXT
+);
+CREATE TABLE IF NOT EXISTS pending_lookups (
+    id INTEGER PRIMARY KEY,
+    flagged_at TEXT
+);
+"""
+
+UPSERT = """
+INSERT INTO reservations (id, hotel_id, room_type, status, check_in, check_out, updated_at)
+VALUES (:id, :hotel_id, :room_type, :status, :check_in, :check_out, :updated_at)
+ON CONFLICT (id) DO UPDATE SET
+    hotel_id = COALESCE(excluded.hotel_id, hotel_id),
+    room_type = COALESCE(excluded.room_type, room_type),
+    status = COALESCE(excluded.status, status),
+    check_in = COALESCE(excluded.check_in, check_in),
+    check_out = COALESCE(excluded.check_out, check_out),
+    updated_at = COALESCE(excluded.updated_at, updated_at)
+WHERE excluded.updated_at IS NULL
+   OR reservations.updated_at IS NULL
+   OR julianday(excluded.updated_at) IS NULL
+   OR julianday(excluded.updated_at) >= julianday(reservations.updated_at)
+"""
+
+COLUMNS = ("hotel_id", "room_type", "status", "check_in", "check_out", "updated_at")
+
+# Columnas sin las que una reserva nueva ensuciaría los agregados
+REQUIRED_COLUMNS = ("hotel_id", "room_type", "status")
+
+
+def _namedtuple_factory(cursor, row):
+    """Row factory con acceso por atributo, como las filas de SQLAlchemy"""
+    Row = namedtuple("Row", [col[0] for col in cursor.description])
+    return Row(*row)
+
+
+def _as_text(value) -> Optional[str]:
+    """Normalizar valores a texto (las fechas en ISO 8601)"""
+    if value is None:
+        return None
+    if isinstance(value, datetime):
+        return value.isoformat()
+    return str(value)
+
+
+class LocalReplica:
+    """
+    Copia local de las reservas para responder analytics sin tocar PostgreSQL
+
+    El consumidor es el único escritor: carga un snapshot inicial y aplica
+    los eventos reservation_*. La API solo lee. La posición de replicación
+    (snapshot, marca de agua de updated_at y último evento aplicado) se guarda
+    en la tabla replication_state.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+
+    @contextmanager
+    def _connect(self) -> Iterator[sqlite3.Connection]:
+        """Abrir una conexión con WAL habilitado dentro de una transacción"""
+        conn = sqlite3.connect(self.path, timeout=10)
+        try:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.row_factory = _namedtuple_factory
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    def initialize(self):
+        """Crear el archivo y el esquema si no existen"""
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with self._connect() as conn:
+            conn.executescript(SCHEMA)
+
+    # ------------------------------------------------------------------
+    # Posición de replicación
+    # ------------------------------------------------------------------
+
+    def position(self) -> Optional[dict]:
+        """
+        Obtener la posición de replicación
+
+        Returns:
+            dict con la posición, o None si no hay snapshot inicial
+        """
+        if not os.path.exists(self.path):
+            return None
+        try:
+            with self._connect() as conn:
+                rows = conn.execute("SELECT key, value FROM replication_state").fetchall()
+        except sqlite3.OperationalError:
+            return None
+
+        state = {r.key: r.value for r in rows}
+        if "snapshot_at" not in state:
+            return None
+        state["events_applied"] = int(state.get("events_applied", 0))
+        return state
+
+    @staticmethod
+    def _set_state(conn: sqlite3.Connection, **values):
+        """Actualizar claves de la posición de replicación"""
+        conn.executemany(
+            "INSERT INTO replication_state (key, value) VALUES (?, ?) "
+            "ON CONFLICT (key) DO UPDATE SET value = excluded.value",
+            [(k, _as_text(v)) for k, v in values.items()]
+        )
+
+    # ------------------------------------------------------------------
+    # Carga desde PostgreSQL
+    # ------------------------------------------------------------------
+
+    @staticmethod
+    def _rows_from_primary(query):
+        """Convertir reservas del ORM en parámetros para el upsert"""
+        for r in query.yield_per(5000):
+            yield {
+                "id": r.id,
+                "hotel_id": r.hotel_id,
+                "room_type": r.room_type,
+                "status": r.status,
+                "check_in": _as_text(r.check_in),
+                "check_out": _as_text(r.check_out),
+                "updated_at": _as_text(r.updated_at)
+            }
+
+    def snapshot(self, db: Session) -> int:
+        """
+        Reconstruir la réplica completa desde la tabla reservations
+
+        Args:
+            db: Sesión de base de datos del primario
+
+        Returns:
+            int: Número de reservas copiadas
+        """
+        self.initialize()
+        started_at = datetime.now()
+        watermark = db.query(Reservation.updated_at).order_by(Reservation.updated_at.desc()).limit(1).scalar()
+
+        with self._connect() as conn:
+            conn.execute("DELETE FROM reservations")
+            conn.execute("DELETE FROM pending_lookups")
+            conn.executemany(UPSERT, self._rows_from_primary(db.query(Reservation)))
+            count = conn.execute("SELECT COUNT(*) AS n FROM reservations").fetchone().n
+            conn.execute("DELETE FROM replication_state")
+            self._set_state(
+                conn,
+                snapshot_at=started_at,
+                watermark=watermark or started_at,
+                events_applied=0
+            )
+
+        logger.info(f"Snapshot de la réplica local completado: {count} reservas")
+        return count
+
+    def catch_up(self, db: Session) -> int:
+        """
+        Ponerse al día con las reservas modificadas desde la marca de agua
+
+        Se usa al arrancar el consumidor para cubrir eventos perdidos mientras
+        estaba detenido. Si no hay snapshot previo, hace uno completo.
+
+        Args:
+            db: Sesión de base de datos del primario
+
+        Returns:
+            int: Número de reservas aplicadas
+        """
+        position = self.position()
+        if position is None:
+            return self.snapshot(db)
+        # Réplicas creadas con versiones anteriores del esquema
+        self.initialize()
+
+        since = datetime.fromisoformat(position["watermark"]) - CATCH_UP_MARGIN
+        query = db.query(Reservation).filter(Reservation.updated_at >= since)
+        watermark = db.query(Reservation.updated_at).order_by(Reservation.updated_at.desc()).limit(1).scalar()
+
+        with self._connect() as conn:
+            before = conn.total_changes
+            conn.executemany(UPSERT, self._rows_from_primary(query))
+            applied = conn.total_changes - before
+            self._set_state(conn, watermark=watermark or position["watermark"], caught_up_at=datetime.now())
+
+        logger.info(f"Réplica local al día: {applied} reservas aplicadas desde {since.isoformat()}")
+        self.resolve_pending(db)
+        return applied
+
+    def resolve_pending(self, db: Session) -> int:
+        """
+        Completar desde el primario las reservas marcadas por eventos incompletos
+
+        Args:
+            db: Sesión de base de datos del primario
+
+        Returns:
+            int: Número de reservas resueltas
+        """
+        with self._connect() as conn:
+            ids = [r.id for r in conn.execute("SELECT id FROM pending_lookups").fetchall()]
+        if not ids:
+            return 0
+
+        query = db.query(Reservation).filter(Reservation.id.in_(ids))
+        with self._connect() as conn:
+            before = conn.total_changes
+            conn.executemany(UPSERT, self._rows_from_primary(query))
+            resolved = conn.total_changes - before
+            # Los ids que el primario no conoce también se descartan
+            conn.executemany("DELETE FROM pending_lookups WHERE id = ?", [(i,) for i in ids])
+
+        logger.info(f"Réplica local: {resolved}/{len(ids)} reservas pendientes completadas desde PostgreSQL")
+        return resolved
+
+    # ------------------------------------------------------------------
+    # Aplicación de eventos
+    # ------------------------------------------------------------------
+
+    def apply_event(self, message: dict) -> bool:
+        """
+        Aplicar un evento reservation_* a la réplica
+
+        Los eventos más antiguos que la fila guardada (p. ej. la cola acumulada
+        que se procesa tras catch_up) no la sobrescriben ni cuentan como
+        aplicados, y no mueven la posición de replicación. Un evento sin hotel,
+        tipo de habitación o estado para una reserva desconocida no se inserta:
+        la reserva queda pendiente de consultarse en el primario.
+
+        Args:
+            message: Evento recibido de RabbitMQ
+
+        Returns:
+            bool: False si el evento no se aplicó (inválido, obsoleto o pendiente de consulta)
+        """
+        event_type = message.get("event")
+        data = message.get("data") or {}
+        reservation_id = data.get("id") or data.get("reservation_id")
+
+        if not event_type or not event_type.startswith("reservation_") or reservation_id is None:
+            return False
+
+        row = {"id": int(reservation_id)}
+        row.update({col: _as_text(data.get(col)) for col in COLUMNS})
+        if event_type == "reservation_cancelled":
+            row["status"] = "cancelled"
+        # Versión del evento para ordenarlo frente a la fila existente
+        row["updated_at"] = row["updated_at"] or _as_text(message.get("timestamp"))
+
+        with self._connect() as conn:
+            if any(row[col] is None for col in REQUIRED_COLUMNS) and conn.execute(
+                "SELECT 1 AS found FROM reservations WHERE id = ?", (row["id"],)
+            ).fetchone() is None:
+                conn.execute(
+                    "INSERT OR IGNORE INTO pending_lookups (id, flagged_at) VALUES (?, ?)",
+                    (row["id"], datetime.now().isoformat())
+                )
+                logger.warning(f"Evento {event_type} incompleto para la reserva {row['id']}, pendiente de consulta")
+                return False
+
+            before = conn.total_changes
+            conn.execute(UPSERT, row)
+            if conn.total_changes == before:
+                # La fila guardada es más reciente: no mover la posición de replicación
+                logger.info(f"Evento {event_type} obsoleto para la reserva {row['id']}, ignorado")
+                return False
+            conn.execute(
+                "UPDATE replication_state SET value = CAST(value AS INTEGER) + 1 WHERE key = 'events_applied'"
+            )
+            self._set_state(
+                conn,
+                last_event=event_type,
+                last_event_timestamp=message.get("timestamp"),
+                last_applied_at=datetime.now()
+            )
+        return True
+
+    # ------------------------------------------------------------------
+    # Consultas analíticas
+    # ------------------------------------------------------------------
+
+    def fetch_breakdowns(self) -> dict:
+        """
+        Calcular los agregados por estado, hotel y tipo de habitación
+
+        Returns:
+            dict con by_status, by_hotel y by_room_type
+        """
+        with self._connect() as conn:
+            return {
+                "by_status": conn.execute(
+                    "SELECT status, COUNT(id) AS count FROM reservations GROUP BY status"
+                ).fetchall(),
+                "by_hotel": conn.execute(
+                    "SELECT hotel_id, COUNT(id) AS count, "
+                    "SUM(status = 'confirmed') AS active "
+                    "FROM reservations GROUP BY hotel_id"
+                ).fetchall(),
+                "by_room_type": conn.execute(
+                    "SELECT room_type, COUNT(id) AS count, "
+                    "SUM(status = 'confirmed') AS active "
+                    "FROM reservations GROUP BY room_type"
+                ).fetchall()
+            }
+
+    def fetch_hotel(self, hotel_id: str) -> tuple:
+        """
+        Obtener total y activas de un hotel
+
+        Returns:
+            tuple: (total, activas)
+        """
+        with self._connect() as conn:
+            row = conn.execute(
+                "SELECT COUNT(id) AS count, COALESCE(SUM(status = 'confirmed'), 0) AS active "
+                "FROM reservations WHERE hotel_id = ?",
+                (hotel_id,)
+            ).fetchone()
+        return row.count, row.active
+
+
+# Instancia global de la réplica
+local_replica = LocalReplica(settings.analytics_replica_path)
@@ -18,11 +18,20 @@ class OccupancyStats(BaseModel):
     by_status: List[dict] = Field(..., description="Estadísticas por estado")
 
 
+class DataFreshness(BaseModel):
+    """Origen y antigüedad de los datos servidos"""
+    source: str = Field(..., description="Origen de los datos: local_replica, materialized_view o live")
+    refreshed_at: Optional[datetime] = Field(None, description="Fecha del último refresco de las vistas")
+    staleness_seconds: Optional[float] = Field(None, description="Antigüedad del último refresco (segundos)")
+    replication_position: Optional[dict] = Field(None, description="Posición de la réplica local")
+
+
 class OccupancyResponse(BaseModel):
     """Respuesta del endpoint de ocupación"""
     success: bool
     message: str
     data: Optional[OccupancyStats] = None
+    freshness: Optional[DataFreshness] = None
     timestamp: datetime = Field(default_factory=datetime.now)
 
 
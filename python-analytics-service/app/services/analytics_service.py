@@ -2,88 +2,95 @@
 Servicio de analytics para generar estadísticas de ocupación
 """
 from sqlalchemy.orm import Session
-from sqlalchemy import func, case
-from app.models import Reservation
-from app.schemas import OccupancyStats
+from sqlalchemy.exc import DBAPIError
+from app import materialized_views, queries
+from app.config import get_settings
+from app.queries import execute_pipelined
+from app.replica import local_replica
+from app.tracing import tracer
+from app.schemas import OccupancyStats, DataFreshness
 from datetime import datetime
+from typing import List, Tuple
 import logging
 
 logger = logging.getLogger(__name__)
+settings = get_settings()
 
 
 class AnalyticsService:
     """Servicio para generar estadísticas de ocupación"""
     
     @staticmethod
-    def get_occupancy_statistics(db: Session) -> OccupancyStats:
+    def get_hotel_breakdown(db: Session) -> List[dict]:
         """
-        Genera estadísticas de ocupación basadas en las reservas
+        Calcula las cifras de ocupación por hotel
         
         Args:
             db: Sesión de base de datos
             
         Returns:
-            OccupancyStats con las estadísticas calculadas
+            Lista con total, activas y tasa de ocupación de cada hotel
         """
-        try:
-            # Contar total de reservaciones
-            total_reservations = db.query(func.count(Reservation.id)).scalar()
-            
-            # Contar por estado
-            active_reservations = db.query(func.count(Reservation.id))\
-                .filter(Reservation.status == 'confirmed').scalar() or 0
-                
-            completed_reservations = db.query(func.count(Reservation.id))\
-                .filter(Reservation.status == 'completed').scalar() or 0
-                
-            cancelled_reservations = db.query(func.count(Reservation.id))\
-                .filter(Reservation.status == 'cancelled').scalar() or 0
-            
-            # Calcular tasa de ocupación
-            occupancy_rate = 0.0
-            if total_reservations > 0:
-                occupancy_rate = round((active_reservations / total_reservations) * 100, 2)
-            
-            # Estadísticas por hotel
-            by_hotel = db.query(
-                Reservation.hotel_id,
-                func.count(Reservation.id).label('count'),
-                func.count(case((Reservation.status == 'confirmed', 1))).label('active')
-            ).group_by(Reservation.hotel_id).all()
-            
-            by_hotel_list = [
-                {
-                    'hotel_id': h.hotel_id,
-                    'total_reservations': h.count,
-                    'active_reservations': h.active,
-                    'occupancy_rate': round((h.active / h.count * 100), 2) if h.count > 0 else 0
-                }
-                for h in by_hotel
-            ]
-            
-            # Estadísticas por tipo de habitación
-            by_room_type = db.query(
-                Reservation.room_type,
-                func.count(Reservation.id).label('count'),
-                func.count(case((Reservation.status == 'confirmed', 1))).label('active')
-            ).group_by(Reservation.room_type).all()
+        if settings.analytics_replica_enabled and local_replica.position() is not None:
+            return AnalyticsService._format_hotels(local_replica.fetch_breakdowns()["by_hotel"])
+        
+        by_hotel, = execute_pipelined(db, [(queries.HOTEL_COUNTS, {})])
+        return AnalyticsService._format_hotels(by_hotel)
+    
+    @staticmethod
+    def _format_hotels(rows) -> List[dict]:
+        """Dar formato a filas (hotel_id, count, active)"""
+        return [
+            {
+                'hotel_id': h.hotel_id,
+                'total_reservations': h.count,
+                'active_reservations': h.active,
+                'occupancy_rate': round((h.active / h.count * 100), 2) if h.count > 0 else 0
+            }
+            for h in rows
+        ]
+    
+    @staticmethod
+    @tracer.start_as_current_span("analytics.build_statistics")
+    def build_statistics(by_status, by_hotel, by_room_type) -> OccupancyStats:
+        """
+        Construye las estadísticas a partir de los agregados por estado, hotel y tipo
+        
+        Los totales se derivan de los conteos por estado, por lo que no hacen
+        falta consultas adicionales.
+        
+        Args:
+            by_status: Filas (status, count)
+            by_hotel: Filas (hotel_id, count, active)
+            by_room_type: Filas (room_type, count, active)
             
-            by_room_type_list = [
+        Returns:
+            OccupancyStats con las estadísticas calculadas
+        """
+        status_counts = {s.status: s.count for s in by_status}
+        total_reservations = sum(status_counts.values())
+        active_reservations = status_counts.get('confirmed', 0)
+        
+        occupancy_rate = 0.0
+        if total_reservations > 0:
+            occupancy_rate = round((active_reservations / total_reservations) * 100, 2)
+        
+        return OccupancyStats(
+            total_reservations=total_reservations,
+            active_reservations=active_reservations,
+            completed_reservations=status_counts.get('completed', 0),
+            cancelled_reservations=status_counts.get('cancelled', 0),
+            occupancy_rate=occupancy_rate,
+            by_hotel=AnalyticsService._format_hotels(by_hotel),
+            by_room_type=[
                 {
                     'room_type': r.room_type,
                     'total_reservations': r.count,
                     'active_reservations': r.active
                 }
                 for r in by_room_type
-            ]
-            
-            # Estadísticas por estado
-            by_status = db.query(
-                Reservation.status,
-                func.count(Reservation.id).label('count')
-            ).group_by(Reservation.status).all()
-            
-            by_status_list = [
+            ],
+            by_status=[
                 {
                     'status': s.status,
                     'count': s.count,
@@ -91,19 +98,151 @@ class AnalyticsService:
                 }
                 for s in by_status
             ]
+        )
+    
+    @staticmethod
+    @tracer.start_as_current_span("analytics.occupancy_report")
+    def get_occupancy_report(db: Session) -> Tuple[OccupancyStats, DataFreshness]:
+        """
+        Obtiene las estadísticas desde las vistas materializadas
+        
+        Con la réplica local habilitada responde desde ella sin tocar PostgreSQL.
+        Si las vistas no existen o están deshabilitadas, recurre a la consulta en vivo.
+        
+        Args:
+            db: Sesión de base de datos
+            
+        Returns:
+            Tupla (OccupancyStats, DataFreshness)
+        """
+        if settings.analytics_replica_enabled:
+            position = local_replica.position()
+            if position is not None:
+                views = local_replica.fetch_breakdowns()
+                stats = AnalyticsService.build_statistics(
+                    views["by_status"], views["by_hotel"], views["by_room_type"]
+                )
+                return stats, AnalyticsService._replica_freshness(position)
+            logger.warning("Réplica local sin snapshot inicial, usando PostgreSQL")
+        
+        if settings.materialized_views_enabled:
+            try:
+                views = materialized_views.fetch_breakdowns(db)
+                if views["refreshed_at"] is not None:
+                    stats = AnalyticsService.build_statistics(
+                        views["by_status"], views["by_hotel"], views["by_room_type"]
+                    )
+                    return stats, DataFreshness(
+                        source="materialized_view",
+                        refreshed_at=views["refreshed_at"],
+                        staleness_seconds=views["staleness_seconds"]
+                    )
+            except DBAPIError as e:
+                db.rollback()
+                logger.warning(f"Vistas materializadas no disponibles, usando consulta en vivo: {e.orig}")
+        
+        stats = AnalyticsService.get_occupancy_statistics(db)
+        return stats, DataFreshness(source="live", refreshed_at=datetime.now(), staleness_seconds=0.0)
+    
+    @staticmethod
+    def _replica_freshness(position: dict) -> DataFreshness:
+        """Describir la frescura de una respuesta servida desde la réplica local"""
+        return DataFreshness(
+            source="local_replica",
+            refreshed_at=position.get("last_applied_at") or position["snapshot_at"],
+            replication_position=position
+        )
+    
+    @staticmethod
+    def get_hotel_statistics(db: Session, hotel_id: int) -> dict:
+        """
+        Calcula las estadísticas de un hotel con consultas en vivo
+        
+        Args:
+            db: Sesión de base de datos
+            hotel_id: ID del hotel
             
-            logger.info(f"Estadísticas generadas: {total_reservations} reservaciones totales")
+        Returns:
+            dict con total, activas y tasa de ocupación del hotel
+        """
+        # Total y activas en una sola consulta (hotel_id se compara como string)
+        rows, = execute_pipelined(db, [(queries.HOTEL_TOTALS, {"hotel_id": str(hotel_id)})])
+        return AnalyticsService._hotel_summary(hotel_id, rows[0].count or 0, rows[0].active or 0)
+    
+    @staticmethod
+    def _hotel_summary(hotel_id: int, total: int, active: int) -> dict:
+        """Dar formato a las cifras de un hotel"""
+        occupancy_rate = round((active / total * 100), 2) if total > 0 else 0
+        return {
+            "hotel_id": hotel_id,
+            "total_reservations": total,
+            "active_reservations": active,
+            "occupancy_rate": occupancy_rate
+        }
+    
+    @staticmethod
+    @tracer.start_as_current_span("analytics.hotel_report")
+    def get_hotel_report(db: Session, hotel_id: int) -> Tuple[dict, DataFreshness]:
+        """
+        Obtiene las estadísticas de un hotel desde la vista materializada, o en vivo si no existe
+        
+        Args:
+            db: Sesión de base de datos
+            hotel_id: ID del hotel
+            
+        Returns:
+            Tupla (estadísticas del hotel, DataFreshness)
+        """
+        if settings.analytics_replica_enabled:
+            position = local_replica.position()
+            if position is not None:
+                total, active = local_replica.fetch_hotel(str(hotel_id))
+                summary = AnalyticsService._hotel_summary(hotel_id, total, active)
+                return summary, AnalyticsService._replica_freshness(position)
+            logger.warning("Réplica local sin snapshot inicial, usando PostgreSQL")
+        
+        if settings.materialized_views_enabled:
+            try:
+                view = materialized_views.fetch_hotel(db, str(hotel_id))
+                if view is not None:
+                    summary = AnalyticsService._hotel_summary(hotel_id, view["count"], view["active"])
+                    return summary, DataFreshness(
+                        source="materialized_view",
+                        refreshed_at=view["refreshed_at"],
+                        staleness_seconds=view["staleness_seconds"]
+                    )
+            except DBAPIError as e:
+                db.rollback()
+                logger.warning(f"Vistas materializadas no disponibles, usando consulta en vivo: {e.orig}")
+        
+        summary = AnalyticsService.get_hotel_statistics(db, hotel_id)
+        return summary, DataFreshness(source="live", refreshed_at=datetime.now(), staleness_seconds=0.0)
+    
+    @staticmethod
+    def get_occupancy_statistics(db: Session) -> OccupancyStats:
+        """
+        Genera estadísticas de ocupación basadas en las reservas
+        
+        Las tres agregaciones son independientes, así que se envían juntas en
+        pipeline como sentencias preparadas: un solo viaje de red por petición.
+        Los totales por estado se derivan de los conteos por estado.
+        
+        Args:
+            db: Sesión de base de datos
+            
+        Returns:
+            OccupancyStats con las estadísticas calculadas
+        """
+        try:
+            by_status, by_hotel, by_room_type = execute_pipelined(db, [
+                (queries.STATUS_COUNTS, {}),
+                (queries.HOTEL_COUNTS, {}),
+                (queries.ROOM_TYPE_COUNTS, {})
+            ])
             
-            return OccupancyStats(
-                total_reservations=total_reservations or 0,
-                active_reservations=active_reservations,
-                completed_reservations=completed_reservations,
-                cancelled_reservations=cancelled_reservations,
-                occupancy_rate=occupancy_rate,
-                by_hotel=by_hotel_list,
-                by_room_type=by_room_type_list,
-                by_status=by_status_list
-            )
+            stats = AnalyticsService.build_statistics(by_status, by_hotel, by_room_type)
+            logger.info(f"Estadísticas generadas: {stats.total_reservations} reservaciones totales")
+            return stats
             
         except Exception as e:
             logger.error(f"Error al generar estadísticas: {e}")
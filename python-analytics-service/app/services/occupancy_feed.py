@@ -0,0 +1,123 @@
+"""
+Listener que alimenta el feed SSE de ocupación a partir de eventos de reservas
+"""
+import json
+import logging
+import threading
+import time
+from typing import Callable, Optional
+from opentelemetry.trace import SpanKind
+from app.broadcaster import OccupancyBroadcaster, build_occupancy_payload
+from app.config import get_settings
+from app.database import SessionLocal
+from app.rabbitmq import RabbitMQClient
+from app.services.analytics_service import AnalyticsService
+from app.shared_cache import hotel_breakdown_cache
+from app.tracing import extract_context, tracer
+
+settings = get_settings()
+logger = logging.getLogger(__name__)
+
+
+class OccupancyFeed:
+    """
+    Hilo que escucha notificaciones reservation_* y difunde cifras por hotel
+
+    Las notificaciones que llegan dentro de la ventana de debounce se agrupan,
+    de modo que una ráfaga de eventos cuesta una sola agregación compartida
+    por todos los clientes conectados. Con varios workers la agregación se
+    comparte también entre procesos a través de hotel_breakdown_cache.
+    """
+
+    def __init__(
+        self,
+        broadcaster: OccupancyBroadcaster,
+        debounce: float,
+        reconnect_delay: float = 5.0,
+        on_event: Optional[Callable[[], None]] = None
+    ):
+        self.broadcaster = broadcaster
+        self.on_event = on_event
+        self.debounce = debounce
+        self.reconnect_delay = reconnect_delay
+        # Pendiente desde el inicio para enviar un estado inicial al primer cliente
+        self._pending = True
+        # Hora de la última notificación: las cifras deben calcularse después
+        self._pending_since = time.time()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        """Iniciar el hilo del listener"""
+        if self._thread and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="occupancy-feed", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """Detener el listener"""
+        self._stop.set()
+
+    def _on_message(self, ch, method, properties, body):
+        """
+        Marcar que hay cambios pendientes de difundir
+
+        El span continúa la traza del publicador con el contexto de las cabeceras.
+        """
+        exchange = settings.rabbitmq_occupancy_exchange
+        with tracer.start_as_current_span(
+            f"{exchange} process",
+            context=extract_context(getattr(properties, "headers", None)),
+            kind=SpanKind.CONSUMER,
+            attributes={"messaging.system": "rabbitmq", "messaging.destination.name": exchange}
+        ) as span:
+            try:
+                event_type = json.loads(body).get('event', '')
+            except ValueError:
+                return
+            span.set_attribute("messaging.event", event_type)
+            if event_type.startswith('reservation_'):
+                self._pending = True
+                self._pending_since = time.time()
+                if self.on_event:
+                    self.on_event()
+
+    def refresh(self):
+        """Recalcular las cifras por hotel y difundirlas"""
+        if settings.shared_cache_enabled:
+            # Un solo worker consulta la base de datos; el resto reutiliza su resultado
+            by_hotel = hotel_breakdown_cache.get_or_compute(self._pending_since, self._compute)
+        else:
+            by_hotel = self._compute()
+        self.broadcaster.publish_threadsafe(build_occupancy_payload(by_hotel))
+
+    @staticmethod
+    def _compute() -> list:
+        """Consultar las cifras por hotel"""
+        db = SessionLocal()
+        try:
+            return AnalyticsService.get_hotel_breakdown(db)
+        finally:
+            db.close()
+
+    def _run(self):
+        """Bucle principal: consumir notificaciones y difundir agrupadas"""
+        while not self._stop.is_set():
+            client = RabbitMQClient(max_retries=1)
+            try:
+                client.connect()
+                client.bind_fanout(settings.rabbitmq_occupancy_exchange, self._on_message)
+                while not self._stop.is_set():
+                    client.connection.process_data_events(time_limit=self.debounce)
+                    if self._pending and self.broadcaster.subscriber_count > 0:
+                        self._pending = False
+                        self.refresh()
+            except Exception as e:
+                logger.warning(f"Feed de ocupación interrumpido: {e}")
+                time.sleep(self.reconnect_delay)
+            finally:
+                try:
+                    client.close()
+                except Exception:
+                    pass
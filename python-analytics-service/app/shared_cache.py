@@ -0,0 +1,235 @@
+"""
+Caché compartida entre workers de las últimas estadísticas de ocupación
+
+Los workers de gunicorn son procesos independientes: sin esta caché cada uno
+calcularía las estadísticas por su cuenta y multiplicaría la carga en
+PostgreSQL. El último resultado se guarda en un archivo mapeado en memoria
+(/dev/shm) que todos los workers leen. Cuando caduca, solo el worker que
+obtiene el flock lo recalcula; el resto sigue sirviendo el valor anterior.
+Las cifras por hotel del feed SSE y las métricas de cancelación de cada
+worker se comparten de la misma forma.
+"""
+import fcntl
+import json
+import logging
+import mmap
+import os
+import struct
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Callable, Iterator, Optional, Tuple
+from app.config import get_settings
+from app.schemas import DataFreshness, OccupancyStats
+
+settings = get_settings()
+logger = logging.getLogger(__name__)
+
+# Cabecera: secuencia (seqlock), hora de escritura, cálculos realizados, longitud del payload
+HEADER = struct.Struct("<QdQI")
+
+
+class SharedSlot:
+    """
+    Último valor JSON calculado, compartido por todos los procesos del host
+
+    Los lectores nunca bloquean (seqlock en la cabecera). Solo escribe quien
+    gana el flock del archivo .lock, de modo que hay un único escritor.
+    """
+
+    def __init__(self, path: str, size: int = 1024 * 1024):
+        self.path = path
+        self.lock_path = f"{path}.lock"
+        self.size = size
+        self._map: Optional[mmap.mmap] = None
+        self._pid: Optional[int] = None
+        self._init_lock = threading.Lock()
+
+    def _mapping(self) -> mmap.mmap:
+        """Abrir (una vez por proceso) el archivo compartido"""
+        if self._map is not None and self._pid == os.getpid():
+            return self._map
+        with self._init_lock:
+            if self._map is None or self._pid != os.getpid():
+                directory = os.path.dirname(self.path)
+                if directory:
+                    os.makedirs(directory, exist_ok=True)
+                fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o600)
+                try:
+                    if os.fstat(fd).st_size < self.size:
+                        os.ftruncate(fd, self.size)
+                    self._map = mmap.mmap(fd, self.size)
+                finally:
+                    os.close(fd)
+                self._pid = os.getpid()
+        return self._map
+
+    def read(self) -> Optional[Tuple[float, Any]]:
+        """
+        Leer la última entrada sin bloquear
+
+        Returns:
+            Tupla (hora del cálculo, payload) o None si está vacía
+        """
+        data = self._mapping()
+        for _ in range(100):
+            seq, stored_at, _, length = HEADER.unpack_from(data, 0)
+            if seq % 2:
+                # Escritura en curso
+                time.sleep(0)
+                continue
+            payload = data[HEADER.size:HEADER.size + length]
+            if HEADER.unpack_from(data, 0)[0] != seq:
+                continue
+            if not length:
+                return None
+            return stored_at, json.loads(payload)
+        return None
+
+    def write(self, payload: Any, stored_at: float):
+        """
+        Publicar una nueva entrada (solo la llama quien tiene el flock)
+
+        Args:
+            payload: Valor serializable en JSON
+            stored_at: Hora (epoch) en que empezó el cálculo
+        """
+        body = json.dumps(payload, default=str).encode()
+        if HEADER.size + len(body) > self.size:
+            logger.warning(f"Valor demasiado grande para la caché compartida {self.path} ({len(body)} bytes)")
+            return
+        data = self._mapping()
+        seq, _, computations, _ = HEADER.unpack_from(data, 0)
+        # Secuencia impar mientras se escribe: los lectores reintentan
+        HEADER.pack_into(data, 0, seq + 1, 0.0, computations, 0)
+        data[HEADER.size:HEADER.size + len(body)] = body
+        HEADER.pack_into(data, 0, seq + 2, stored_at, computations + 1, len(body))
+
+    def update(self, mutate: Callable[[Any], Any]):
+        """
+        Leer, modificar y reescribir el valor bajo el flock
+
+        Para valores con varios escritores (p. ej. contadores por worker).
+
+        Args:
+            mutate: Función que recibe el payload actual (o None) y devuelve el nuevo
+        """
+        with self.elect(blocking=True):
+            entry = self.read()
+            self.write(mutate(entry[1] if entry is not None else None), stored_at=time.time())
+
+    @property
+    def computations(self) -> int:
+        """Veces que algún proceso ha recalculado el valor"""
+        return HEADER.unpack_from(self._mapping(), 0)[2]
+
+    @contextmanager
+    def elect(self, blocking: bool) -> Iterator[bool]:
+        """
+        Intentar ser el proceso que recalcula
+
+        Yields:
+            bool: True si se obtuvo el flock (sin bloquear, puede ser False)
+        """
+        with open(self.lock_path, "a") as lock_file:
+            try:
+                fcntl.flock(lock_file, fcntl.LOCK_EX | (0 if blocking else fcntl.LOCK_NB))
+            except BlockingIOError:
+                yield False
+                return
+            try:
+                yield True
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+class SharedStatsCache(SharedSlot):
+    """Último OccupancyStats calculado, con caducidad por TTL"""
+
+    def __init__(self, path: str, ttl: float, size: int = 1024 * 1024):
+        super().__init__(path, size)
+        self.ttl = ttl
+
+    def get_or_compute(
+        self,
+        compute: Callable[[], Tuple[OccupancyStats, Optional[DataFreshness]]]
+    ) -> Tuple[OccupancyStats, Optional[DataFreshness]]:
+        """
+        Devolver las estadísticas en caché o recalcularlas si caducaron
+
+        Solo un worker recalcula a la vez. Los demás sirven la entrada caducada
+        mientras exista; si la caché está vacía esperan al que calcula.
+
+        Args:
+            compute: Función que calcula (OccupancyStats, DataFreshness)
+        """
+        entry = self.read()
+        if entry is not None and time.time() - entry[0] < self.ttl:
+            return self._decode(*entry)
+
+        with self.elect(blocking=entry is None) as elected:
+            if not elected:
+                # Otro worker está recalculando: servir el valor anterior
+                return self._decode(*entry)
+            # Puede que otro worker haya escrito mientras se esperaba el lock
+            entry = self.read()
+            if entry is not None and time.time() - entry[0] < self.ttl:
+                return self._decode(*entry)
+            started_at = time.time()
+            stats, freshness = compute()
+            self.write({
+                "stats": stats.model_dump(mode="json"),
+                "freshness": freshness.model_dump(mode="json") if freshness else None
+            }, stored_at=started_at)
+            return stats, freshness
+
+    @staticmethod
+    def _decode(stored_at: float, payload: dict) -> Tuple[OccupancyStats, Optional[DataFreshness]]:
+        """Reconstruir los modelos sumando a la antigüedad el tiempo pasado en caché"""
+        freshness = DataFreshness.model_validate(payload["freshness"]) if payload.get("freshness") else None
+        if freshness is not None and freshness.staleness_seconds is not None:
+            freshness.staleness_seconds = round(
+                freshness.staleness_seconds + max(time.time() - stored_at, 0.0), 3
+            )
+        return OccupancyStats.model_validate(payload["stats"]), freshness
+
+
+class SharedBreakdownCache(SharedSlot):
+    """Cifras por hotel del feed SSE, calculadas por un solo worker tras cada ráfaga de eventos"""
+
+    def get_or_compute(self, not_before: float, compute: Callable[[], list]) -> list:
+        """
+        Devolver unas cifras calculadas después de not_before
+
+        A diferencia de las estadísticas, aquí no se sirve un valor anterior:
+        el feed debe reflejar los eventos recibidos. Quien no gana el flock
+        espera al que calcula y reutiliza su resultado.
+
+        Args:
+            not_before: Hora (epoch) de la última notificación pendiente
+            compute: Función que calcula las cifras por hotel
+        """
+        entry = self.read()
+        if entry is not None and entry[0] >= not_before:
+            return entry[1]
+
+        with self.elect(blocking=True):
+            entry = self.read()
+            if entry is not None and entry[0] >= not_before:
+                return entry[1]
+            started_at = time.time()
+            by_hotel = compute()
+            self.write(by_hotel, stored_at=started_at)
+            return by_hotel
+
+
+def _sibling_path(path: str, suffix: str) -> str:
+    """Ruta hermana de la caché principal (analytics_occupancy.cache -> analytics_occupancy_by_hotel.cache)"""
+    base, ext = os.path.splitext(path)
+    return f"{base}_{suffix}{ext}"
+
+
+# Instancia global de la caché compartida
+stats_cache = SharedStatsCache(settings.shared_cache_path, settings.shared_cache_ttl_seconds)
+hotel_breakdown_cache = SharedBreakdownCache(_sibling_path(settings.shared_cache_path, "by_hotel"))
+worker_metrics_slot = SharedSlot(_sibling_path(settings.shared_cache_path, "metrics"))
@@ -0,0 +1,168 @@
+"""
+Trazas distribuidas (OpenTelemetry) para HTTP, SQL y RabbitMQ
+"""
+import logging
+import os
+from opentelemetry import propagate, trace
+from opentelemetry.sdk.resources import Resource
+from opentelemetry.sdk.trace import TracerProvider
+from opentelemetry.sdk.trace.export import BatchSpanProcessor, ConsoleSpanExporter
+from opentelemetry.sdk.trace.sampling import ParentBased, TraceIdRatioBased
+from opentelemetry.trace import Span, SpanKind, Status, StatusCode
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from app.config import get_settings
+
+settings = get_settings()
+logger = logging.getLogger(__name__)
+
+tracer = trace.get_tracer("analytics-service")
+
+
+def setup_tracing(service_name: str, engine: Engine = None) -> bool:
+    """
+    Configurar el proveedor de trazas según la configuración
+
+    Sin TRACING_ENABLED el API de OpenTelemetry queda en modo no-op y
+    las trazas no tienen coste apreciable.
+
+    Args:
+        service_name: Nombre del servicio en las trazas
+        engine: Motor de SQLAlchemy a instrumentar
+
+    Returns:
+        bool: True si las trazas quedaron habilitadas
+    """
+    if not settings.tracing_enabled:
+        return False
+
+    provider = TracerProvider(
+        resource=Resource.create({"service.name": service_name}),
+        # Respetar la decisión del padre para no romper trazas entre servicios
+        sampler=ParentBased(TraceIdRatioBased(settings.tracing_sample_ratio))
+    )
+    provider.add_span_processor(BatchSpanProcessor(_build_exporter()))
+    trace.set_tracer_provider(provider)
+
+    if engine is not None:
+        instrument_engine(engine)
+
+    logger.info(
+        f"Trazas habilitadas ({settings.tracing_exporter}, muestreo {settings.tracing_sample_ratio:.0%})"
+    )
+    return True
+
+
+def _build_exporter() -> ConsoleSpanExporter:
+    """Crear el exportador local (consola o archivo JSON lines)"""
+    if settings.tracing_exporter == "file":
+        directory = os.path.dirname(settings.tracing_file_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        return ConsoleSpanExporter(
+            out=open(settings.tracing_file_path, "a", encoding="utf-8"),
+            formatter=lambda span: span.to_json(indent=None) + "\n"
+        )
+    return ConsoleSpanExporter()
+
+
+def start_statement_span(statement: str) -> Span:
+    """Iniciar el span de una sentencia SQL (hijo del span actual)"""
+    operation = statement.lstrip().split(None, 1)[0].upper() if statement.strip() else "SQL"
+    return tracer.start_span(
+        f"db {operation}",
+        kind=SpanKind.CLIENT,
+        attributes={
+            "db.system": "postgresql",
+            "db.name": settings.db_name,
+            "db.statement": statement,
+            "db.operation": operation
+        }
+    )
+
+
+def instrument_engine(engine: Engine):
+    """Crear un span por cada sentencia SQL ejecutada por el motor"""
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def _before_execute(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("_trace_spans", []).append(start_statement_span(statement))
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def _after_execute(conn, cursor, statement, parameters, context, executemany):
+        spans = conn.info.get("_trace_spans")
+        if spans:
+            spans.pop().end()
+
+    @event.listens_for(engine, "handle_error")
+    def _on_error(exception_context):
+        conn = exception_context.connection
+        spans = conn.info.get("_trace_spans") if conn is not None else None
+        if spans:
+            span = spans.pop()
+            span.record_exception(exception_context.original_exception)
+            span.set_status(Status(StatusCode.ERROR))
+            span.end()
+
+
+class TracingMiddleware:
+    """
+    Middleware ASGI que crea un span por petición HTTP
+
+    Es ASGI puro a propósito: @app.middleware("http") (BaseHTTPMiddleware)
+    oculta el mensaje http.disconnect al endpoint y la cancelación de
+    consultas por desconexión del cliente dejaría de funcionar.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        method = scope["method"]
+        path = scope["path"]
+        headers = {key.decode("latin-1"): value.decode("latin-1") for key, value in scope.get("headers", [])}
+        with tracer.start_as_current_span(
+            f"{method} {path}",
+            context=extract_context(headers),
+            kind=SpanKind.SERVER,
+            attributes={"http.method": method, "http.target": path},
+            record_exception=False,
+            set_status_on_exception=False
+        ) as span:
+
+            async def send_wrapper(message):
+                if message["type"] == "http.response.start":
+                    status_code = message["status"]
+                    span.set_attribute("http.status_code", status_code)
+                    if status_code >= 500:
+                        span.set_status(Status(StatusCode.ERROR))
+                await send(message)
+
+            try:
+                await self.app(scope, receive, send_wrapper)
+            except Exception as e:
+                span.record_exception(e)
+                span.set_status(Status(StatusCode.ERROR))
+                raise
+            finally:
+                # FastAPI deja la ruta resuelta en el scope compartido
+                route = scope.get("route")
+                if route is not None:
+                    span.update_name(f"{method} {route.path}")
+                    span.set_attribute("http.route", route.path)
+
+
+def inject_headers(headers: dict = None) -> dict:
+    """Añadir el contexto de traza actual (traceparent) a las cabeceras AMQP"""
+    headers = dict(headers or {})
+    propagate.inject(headers)
+    return headers
+
+
+def extract_context(headers: dict):
+    """Obtener el contexto de traza propagado en las cabeceras de un mensaje"""
+    return propagate.extract(headers or {})
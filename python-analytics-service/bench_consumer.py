@@ -0,0 +1,280 @@
+"""
+Harness de carga para consumer.py
+
+Publica eventos reservation_created/updated/cancelled a un ritmo configurable
+a través de RabbitMQClient y los procesa con el callback real del consumidor.
+Mide throughput, latencia de extremo a extremo (publicación -> ack) y el
+crecimiento del backlog.
+
+Por defecto usa un broker en proceso; con --broker usa el RabbitMQ configurado.
+
+Uso:
+    python bench_consumer.py --rate 500 --duration 10
+    python bench_consumer.py --rate 200 --duration 30 --mix created=50,updated=40,cancelled=10 --broker
+"""
+import argparse
+import json
+import logging
+import queue
+import random
+import statistics
+import threading
+import time
+from datetime import datetime
+from types import SimpleNamespace
+from app.config import get_settings
+from app.consumer_metrics import consumer_metrics, published_at
+from app.rabbitmq import RabbitMQClient
+import consumer
+
+settings = get_settings()
+
+HOTELS = [1, 2, 3, 4, 5]
+ROOM_TYPES = ['single', 'double', 'deluxe', 'suite', 'presidential']
+STATUSES = ['confirmed', 'completed', 'pending']
+
+
+class InProcessBroker:
+    """Sustituto en memoria de RabbitMQ con colas FIFO y sin persistencia"""
+
+    def __init__(self):
+        self.queues = {}
+        self._tags = 0
+        self._lock = threading.Lock()
+
+    def queue(self, name: str) -> queue.Queue:
+        with self._lock:
+            if name not in self.queues:
+                self.queues[name] = queue.Queue()
+            return self.queues[name]
+
+    def next_tag(self) -> int:
+        with self._lock:
+            self._tags += 1
+            return self._tags
+
+    def connection(self) -> "InProcessConnection":
+        return InProcessConnection(self)
+
+
+class InProcessChannel:
+    """Canal compatible con la parte de pika que usa RabbitMQClient"""
+
+    is_open = True
+    is_closed = False
+
+    def __init__(self, broker: InProcessBroker):
+        self.broker = broker
+
+    def queue_declare(self, queue, passive=False, **kwargs):
+        depth = self.broker.queue(queue).qsize()
+        return SimpleNamespace(method=SimpleNamespace(queue=queue, message_count=depth, consumer_count=1))
+
+    def exchange_declare(self, **kwargs):
+        pass
+
+    def basic_publish(self, exchange, routing_key, body, properties=None):
+        # Codificar como lo haría pika para detectar cabeceras que el broker real rechazaría
+        if properties is not None:
+            properties.encode()
+        # Los exchanges fanout no tienen suscriptores en el harness
+        if exchange == '':
+            self.broker.queue(routing_key).put((body, properties))
+
+    def basic_ack(self, delivery_tag):
+        pass
+
+    def basic_nack(self, delivery_tag, requeue=True):
+        pass
+
+
+class InProcessConnection:
+    """Conexión en memoria que entrega siempre el mismo canal"""
+
+    is_open = True
+    is_closed = False
+
+    def __init__(self, broker: InProcessBroker):
+        self._channel = InProcessChannel(broker)
+
+    def channel(self) -> InProcessChannel:
+        return self._channel
+
+    def close(self):
+        pass
+
+
+class AckRecorder:
+    """Envuelve el canal real para medir la latencia publicación -> ack"""
+
+    def __init__(self, channel, published, latencies: list):
+        self.channel = channel
+        self.published = published
+        self.latencies = latencies
+
+    def basic_ack(self, delivery_tag):
+        self.channel.basic_ack(delivery_tag=delivery_tag)
+        if self.published is not None:
+            self.latencies.append(time.time() - self.published)
+
+    def basic_nack(self, delivery_tag, requeue=True):
+        self.channel.basic_nack(delivery_tag=delivery_tag, requeue=requeue)
+
+
+def parse_mix(mix: str) -> tuple:
+    """Convertir 'created=60,updated=30,cancelled=10' en (eventos, pesos)"""
+    events, weights = [], []
+    for part in mix.split(','):
+        name, weight = part.split('=')
+        events.append(f"reservation_{name.strip()}")
+        weights.append(float(weight))
+    return events, weights
+
+
+def build_event(seq: int, event_type: str) -> dict:
+    """Generar un evento de reserva de prueba"""
+    return {
+        "event": event_type,
+        "timestamp": datetime.now().isoformat(),
+        "data": {
+            "id": seq,
+            "hotel_id": random.choice(HOTELS),
+            "room_type": random.choice(ROOM_TYPES),
+            "status": 'cancelled' if event_type == 'reservation_cancelled' else random.choice(STATUSES)
+        }
+    }
+
+
+def publish_load(client: RabbitMQClient, rate: float, duration: float, mix: tuple, done: threading.Event) -> int:
+    """Publicar eventos al ritmo indicado durante duration segundos"""
+    events, weights = mix
+    interval = 1.0 / rate
+    start = time.perf_counter()
+    sent = 0
+    try:
+        while time.perf_counter() - start < duration:
+            client.publish_message(build_event(sent, random.choices(events, weights)[0]), retry=False)
+            sent += 1
+            # Ritmo constante sin acumular deriva
+            delay = start + sent * interval - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+    finally:
+        # Liberar al consumidor aunque la publicación falle
+        done.set()
+    return sent
+
+
+def consume_in_process(broker: InProcessBroker, latencies: list, stop: threading.Event):
+    """Procesar mensajes del broker en proceso con el callback del consumidor"""
+    channel = broker.connection().channel()
+    q = broker.queue(settings.rabbitmq_queue)
+    while not stop.is_set() or not q.empty():
+        try:
+            body, properties = q.get(timeout=0.1)
+        except queue.Empty:
+            continue
+        method = SimpleNamespace(delivery_tag=broker.next_tag())
+        recorder = AckRecorder(channel, published_at(properties, json.loads(body)), latencies)
+        consumer.callback(recorder, method, properties, body)
+
+
+def consume_from_broker(latencies: list, stop: threading.Event):
+    """Procesar mensajes del RabbitMQ real hasta que se vacíe la cola tras publicar"""
+    client = RabbitMQClient()
+    client.connect()
+    client.channel.basic_qos(prefetch_count=1)
+
+    def on_message(ch, method, properties, body):
+        recorder = AckRecorder(ch, published_at(properties, json.loads(body)), latencies)
+        consumer.callback(recorder, method, properties, body)
+
+    client.channel.basic_consume(queue=settings.rabbitmq_queue, on_message_callback=on_message)
+    while not (stop.is_set() and client.get_queue_stats()["message_count"] == 0):
+        client.connection.process_data_events(time_limit=0.2)
+    client.close()
+
+
+def sample_backlog(depth_fn, samples: list, stop: threading.Event, interval: float = 0.5):
+    """Registrar la profundidad de la cola a intervalos regulares"""
+    start = time.perf_counter()
+    while not stop.is_set():
+        samples.append((time.perf_counter() - start, depth_fn()))
+        stop.wait(interval)
+
+
+def percentile(values: list, pct: float) -> float:
+    """Percentil simple sobre una lista ordenada"""
+    return values[min(int(len(values) * pct), len(values) - 1)]
+
+
+def main(args):
+    """Función principal"""
+    # consumer.py configura INFO al importarse; el log por mensaje domina el coste si no se silencia
+    if not args.verbose:
+        logging.getLogger().setLevel(logging.WARNING)
+    mix = parse_mix(args.mix)
+
+    publisher = RabbitMQClient(max_retries=1)
+    if args.broker:
+        publisher.connect()
+        consumer.rabbitmq_client.connect()
+        depth_client = RabbitMQClient()
+        depth_fn = lambda: depth_client.get_queue_stats()["message_count"]
+    else:
+        broker = InProcessBroker()
+        for client in (publisher, consumer.rabbitmq_client):
+            client.connection = broker.connection()
+            client.channel = client.connection.channel()
+        depth_fn = broker.queue(settings.rabbitmq_queue).qsize
+
+    latencies, backlog = [], []
+    published_done, sampler_stop = threading.Event(), threading.Event()
+
+    if args.broker:
+        worker = threading.Thread(target=consume_from_broker, args=(latencies, published_done))
+    else:
+        worker = threading.Thread(target=consume_in_process, args=(broker, latencies, published_done))
+    sampler = threading.Thread(target=sample_backlog, args=(depth_fn, backlog, sampler_stop))
+
+    print(f"🚀 Publicando {args.rate:.0f} eventos/s durante {args.duration:.0f}s "
+          f"({'RabbitMQ' if args.broker else 'broker en proceso'})")
+    start = time.perf_counter()
+    worker.start()
+    sampler.start()
+    sent = publish_load(publisher, args.rate, args.duration, mix, published_done)
+    publish_elapsed = time.perf_counter() - start
+    worker.join()
+    total_elapsed = time.perf_counter() - start
+    sampler_stop.set()
+    sampler.join()
+
+    processed = len(latencies)
+    latencies.sort()
+    peak = max((d for _, d in backlog), default=0)
+    end_of_publish = [d for t, d in backlog if t <= publish_elapsed]
+    growth = (end_of_publish[-1] - end_of_publish[0]) / publish_elapsed if end_of_publish else 0.0
+
+    print("\n📊 Resultados")
+    print(f"  Publicados:            {sent} ({sent / publish_elapsed:.1f}/s)")
+    print(f"  Procesados:            {processed} ({processed / total_elapsed:.1f}/s)")
+    if latencies:
+        print(f"  Latencia p50/p95/p99:  {statistics.median(latencies) * 1000:.2f} / "
+              f"{percentile(latencies, 0.95) * 1000:.2f} / {percentile(latencies, 0.99) * 1000:.2f} ms")
+        print(f"  Latencia máxima:       {latencies[-1] * 1000:.2f} ms")
+    print(f"  Backlog pico:          {peak} mensajes")
+    print(f"  Crecimiento backlog:   {growth:+.1f} mensajes/s durante la publicación")
+    print(f"  Drenado tras publicar: {total_elapsed - publish_elapsed:.2f}s")
+    print("\n  Tiempo por tipo de evento:")
+    for name, stats in consumer_metrics.snapshot()["events"].items():
+        print(f"    - {name}: {stats['count']} eventos, media {stats['avg_ms']} ms, máx {stats['max_ms']} ms")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rate', type=float, default=500, help='Eventos por segundo')
+    parser.add_argument('--duration', type=float, default=10, help='Segundos de publicación')
+    parser.add_argument('--mix', default='created=60,updated=30,cancelled=10', help='Proporción de eventos')
+    parser.add_argument('--broker', action='store_true', help='Usar el RabbitMQ configurado')
+    parser.add_argument('--verbose', action='store_true', help='Mantener el log INFO del consumidor')
+    main(parser.parse_args())
@@ -0,0 +1,157 @@
+"""
+Benchmark: consultas ORM secuenciales frente a sentencias preparadas en pipeline
+
+Compara la ruta original de get_occupancy_statistics (siete consultas ORM,
+una tras otra) con la ruta actual (tres sentencias Core preparadas en un
+solo pipeline), esta última con y sin sentencias preparadas. Reporta los
+viajes de red por petición contados en la traza del protocolo (PQtrace), la
+latencia de cada ruta y si PostgreSQL usa planes genéricos o personalizados
+para las sentencias preparadas.
+
+Uso:
+    python bench_queries.py --iterations 200
+"""
+import argparse
+import statistics
+import tempfile
+import time
+from contextlib import contextmanager
+from psycopg import pq
+from sqlalchemy import case, func, text
+from sqlalchemy.exc import DBAPIError
+from app.config import get_settings
+from app.database import SessionLocal
+from app.models import Reservation
+from app.services.analytics_service import AnalyticsService
+
+settings = get_settings()
+
+
+def legacy_statistics(db):
+    """Ruta original: siete consultas ORM secuenciales"""
+    db.query(func.count(Reservation.id)).scalar()
+    for status in ('confirmed', 'completed', 'cancelled'):
+        db.query(func.count(Reservation.id)).filter(Reservation.status == status).scalar()
+    active = func.count(case((Reservation.status == 'confirmed', 1)))
+    db.query(Reservation.hotel_id, func.count(Reservation.id), active).group_by(Reservation.hotel_id).all()
+    db.query(Reservation.room_type, func.count(Reservation.id), active).group_by(Reservation.room_type).all()
+    db.query(Reservation.status, func.count(Reservation.id)).group_by(Reservation.status).all()
+
+
+def measure(db, fn, iterations: int) -> list:
+    """Medir la latencia de fn en milisegundos"""
+    timings = []
+    for _ in range(iterations):
+        start = time.perf_counter()
+        fn(db)
+        db.rollback()
+        timings.append((time.perf_counter() - start) * 1000)
+    return sorted(timings)
+
+
+# Mensajes con los que el cliente pide la respuesta del servidor y la espera
+SYNC_MESSAGES = {"Query", "Sync", "Flush"}
+
+
+def frontend_message(line: str):
+    """Tipo de mensaje de una línea de PQtrace si la envió el cliente (F), o None"""
+    parts = line.rstrip("\n").split("\t")
+    # Sin SUPPRESS_TIMESTAMPS la línea empieza por la marca de tiempo
+    for i, part in enumerate(parts[:2]):
+        if part in ("F", "B"):
+            if part == "F" and len(parts) > i + 2 and parts[i + 2].strip():
+                return parts[i + 2].split()[0]
+            return None
+    return None
+
+
+def count_round_trips(db, fn) -> int:
+    """
+    Contar los viajes de red de fn con la traza del protocolo de libpq
+
+    Cada Query (protocolo simple), Sync o Flush que envía el cliente le hace
+    esperar la respuesta del servidor. En pipeline las sentencias viajan juntas
+    hasta un único Sync.
+    """
+    pgconn = db.connection().connection.driver_connection.pgconn
+    with tempfile.TemporaryFile("w+") as trace_file:
+        pgconn.trace(trace_file.fileno())
+        pgconn.set_trace_flags(pq.Trace.SUPPRESS_TIMESTAMPS | pq.Trace.REGRESS_MODE)
+        try:
+            fn(db)
+        finally:
+            pgconn.untrace()
+        db.rollback()
+        trace_file.seek(0)
+        return sum(1 for line in trace_file if frontend_message(line) in SYNC_MESSAGES)
+
+
+@contextmanager
+def prepared_statements(enabled: bool):
+    """Forzar DB_PREPARED_STATEMENTS durante la medición"""
+    previous = settings.db_prepared_statements
+    settings.db_prepared_statements = enabled
+    try:
+        yield
+    finally:
+        settings.db_prepared_statements = previous
+
+
+def plan_cache(db) -> list:
+    """Planes genéricos y personalizados de las sentencias preparadas de la sesión (PostgreSQL 14+)"""
+    try:
+        rows = db.execute(text(
+            "SELECT statement, generic_plans, custom_plans FROM pg_prepared_statements ORDER BY statement"
+        )).all()
+    except DBAPIError:
+        rows = []
+    db.rollback()
+    return rows
+
+
+def report(name: str, timings: list, round_trips: int):
+    """Imprimir p50/p95 y viajes de red"""
+    p95 = timings[int(len(timings) * 0.95) - 1]
+    print(f"  {name:<22} viajes={round_trips}  p50={statistics.median(timings):8.2f} ms  p95={p95:8.2f} ms")
+
+
+def main():
+    """Función principal"""
+    parser = argparse.ArgumentParser(description="Comparar ORM secuencial y pipeline preparado")
+    parser.add_argument('--iterations', type=int, default=200)
+    args = parser.parse_args()
+
+    db = SessionLocal()
+    try:
+        pipelined = AnalyticsService.get_occupancy_statistics
+
+        # Calentar la conexión y superar DB_PREPARE_THRESHOLD y los cinco planes
+        # personalizados tras los que PostgreSQL puede pasar a un plan genérico
+        for _ in range(max(settings.db_prepare_threshold, 5) + 5):
+            legacy_statistics(db)
+            db.rollback()
+            for enabled in (False, True):
+                with prepared_statements(enabled):
+                    pipelined(db)
+                db.rollback()
+
+        print(f"📊 get_occupancy_statistics ({args.iterations} iteraciones)")
+        report("ORM secuencial", measure(db, legacy_statistics, args.iterations), count_round_trips(db, legacy_statistics))
+        with prepared_statements(False):
+            unprepared = measure(db, pipelined, args.iterations)
+            report("Pipeline sin preparar", unprepared, count_round_trips(db, pipelined))
+        with prepared_statements(True):
+            prepared = measure(db, pipelined, args.iterations)
+            report("Preparado + pipeline", prepared, count_round_trips(db, pipelined))
+
+        saved = statistics.median(unprepared) - statistics.median(prepared)
+        print(f"\n  Ahorro medido de las sentencias preparadas (p50): {saved:.3f} ms por petición")
+        print("  Planes de las sentencias preparadas (genéricos / personalizados):")
+        for row in plan_cache(db):
+            print(f"    {row.generic_plans:>6} / {row.custom_plans:<6} {' '.join(row.statement.split())[:70]}")
+    finally:
+        db.close()
+
+
+if __name__ == '__main__':
+    main()
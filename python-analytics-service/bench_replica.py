@@ -0,0 +1,67 @@
+"""
+Benchmark: estadísticas desde PostgreSQL frente a la réplica local
+
+Ejecuta cada ruta varias veces y muestra latencias p50/p95. Requiere que
+la réplica tenga un snapshot (python rebuild_replica.py --full).
+
+Uso:
+    python bench_replica.py --iterations 200
+"""
+import argparse
+import statistics
+import time
+from app.database import SessionLocal
+from app.replica import local_replica
+from app.services.analytics_service import AnalyticsService
+
+
+def measure(fn, iterations: int) -> list:
+    """Medir la latencia de fn en milisegundos"""
+    timings = []
+    for _ in range(iterations):
+        start = time.perf_counter()
+        fn()
+        timings.append((time.perf_counter() - start) * 1000)
+    return timings
+
+
+def report(name: str, timings: list):
+    """Imprimir p50/p95 de una serie de latencias"""
+    timings = sorted(timings)
+    p95 = timings[int(len(timings) * 0.95) - 1]
+    print(f"  {name:<12} p50={statistics.median(timings):8.2f} ms  p95={p95:8.2f} ms")
+
+
+def main():
+    """Función principal"""
+    parser = argparse.ArgumentParser(description="Comparar PostgreSQL y la réplica local")
+    parser.add_argument('--iterations', type=int, default=200)
+    args = parser.parse_args()
+
+    if local_replica.position() is None:
+        print("❌ La réplica local no tiene snapshot. Ejecuta: python rebuild_replica.py --full")
+        return
+
+    db = SessionLocal()
+    try:
+        def postgres():
+            AnalyticsService.get_occupancy_statistics(db)
+            db.rollback()
+
+        def replica():
+            views = local_replica.fetch_breakdowns()
+            AnalyticsService.build_statistics(views["by_status"], views["by_hotel"], views["by_room_type"])
+
+        # Calentar conexiones y cachés
+        postgres()
+        replica()
+
+        print(f"📊 Estadísticas de ocupación ({args.iterations} iteraciones)")
+        report("PostgreSQL", measure(postgres, args.iterations))
+        report("Réplica", measure(replica, args.iterations))
+    finally:
+        db.close()
+
+
+if __name__ == '__main__':
+    main()
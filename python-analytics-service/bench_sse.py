@@ -0,0 +1,95 @@
+"""
+Benchmark del difusor SSE con muchos suscriptores simulados
+
+Mide la memoria por conexión, el tiempo de difusión y verifica que los
+clientes lentos se desconectan por contrapresión.
+
+Uso:
+    python bench_sse.py --subscribers 5000 --slow 500 --events 50 --interval 0.05
+"""
+import argparse
+import asyncio
+import logging
+import time
+import tracemalloc
+from app.broadcaster import OccupancyBroadcaster, build_occupancy_payload
+
+HOTELS = [1, 2, 3, 4, 5]
+
+# Silenciar el aviso por cada cliente lento desconectado
+logging.getLogger('app.broadcaster').setLevel(logging.ERROR)
+
+
+def sample_payload(seq: int) -> dict:
+    """Generar cifras de ocupación de prueba"""
+    return build_occupancy_payload([
+        {
+            'hotel_id': str(h),
+            'total_reservations': 100 + seq,
+            'active_reservations': 40 + (seq % 10),
+            'occupancy_rate': round((40 + (seq % 10)) / (100 + seq) * 100, 2)
+        }
+        for h in HOTELS
+    ])
+
+
+async def fast_client(broadcaster: OccupancyBroadcaster, counter: list):
+    """Cliente que consume todos los frames"""
+    subscriber = broadcaster.subscribe()
+
+    async def connected():
+        return False
+
+    async for frame in broadcaster.stream(subscriber, connected, keepalive=60):
+        counter[0] += 1
+
+
+async def main(args):
+    """Función principal"""
+    broadcaster = OccupancyBroadcaster(max_queue_size=args.queue_size)
+    received = [0]
+
+    tracemalloc.start()
+    baseline = tracemalloc.get_traced_memory()[0]
+
+    tasks = [asyncio.create_task(fast_client(broadcaster, received)) for _ in range(args.subscribers)]
+    # Los clientes lentos se registran pero nunca leen su cola
+    slow = [broadcaster.subscribe() for _ in range(args.slow)]
+    await asyncio.sleep(0)
+
+    connected_memory = tracemalloc.get_traced_memory()[0] - baseline
+    total = args.subscribers + args.slow
+    print(f"Suscriptores conectados: {broadcaster.subscriber_count}")
+    print(f"Memoria por conexión:    {connected_memory / total:,.0f} bytes")
+
+    elapsed = 0.0
+    for seq in range(args.events):
+        start = time.perf_counter()
+        broadcaster.publish(sample_payload(seq))
+        elapsed += time.perf_counter() - start
+        # Dejar que los clientes rápidos vacíen su cola entre eventos
+        await asyncio.sleep(args.interval)
+
+    peak = tracemalloc.get_traced_memory()[1] - baseline
+    tracemalloc.stop()
+
+    dropped = sum(1 for s in slow if s.dropped)
+    print(f"Eventos difundidos:      {args.events}, difusión {elapsed * 1000:.1f} ms "
+          f"({elapsed / args.events * 1000:.2f} ms/evento)")
+    print(f"Frames entregados:       {received[0]:,} (esperados {args.events * args.subscribers:,})")
+    print(f"Clientes lentos caídos:  {dropped}/{args.slow}")
+    print(f"Memoria pico por conexión: {peak / total:,.0f} bytes")
+
+    for task in tasks:
+        task.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--subscribers', type=int, default=5000)
+    parser.add_argument('--slow', type=int, default=500)
+    parser.add_argument('--events', type=int, default=50)
+    parser.add_argument('--queue-size', type=int, default=16)
+    parser.add_argument('--interval', type=float, default=0.05, help='Segundos entre eventos')
+    asyncio.run(main(parser.parse_args()))
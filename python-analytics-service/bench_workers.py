@@ -0,0 +1,158 @@
+"""
+Benchmark: escalado del throughput con el número de workers de gunicorn
+
+Arranca el servicio con gunicorn.conf.py para cada número de workers, lo
+carga con varios procesos cliente durante un tiempo fijo y reporta
+peticiones por segundo, latencia y cuántas veces se recalcularon las
+estadísticas (con la caché compartida debería ser una por TTL, no una
+por worker ni por petición).
+
+Uso:
+    python bench_workers.py --workers 1,2,4 --duration 10
+    python bench_workers.py --workers 1,2,4 --path /health/live
+"""
+import argparse
+import http.client
+import multiprocessing
+import os
+import statistics
+import subprocess
+import sys
+import threading
+import time
+import urllib.request
+from jose import jwt
+from app.config import get_settings
+from app.shared_cache import stats_cache
+
+settings = get_settings()
+
+
+def admin_token() -> str:
+    """Token JWT de admin firmado con la misma secret que Laravel"""
+    now = int(time.time())
+    return jwt.encode(
+        {
+            "sub": "bench", "email": "bench@example.com", "role": "admin",
+            "iss": settings.jwt_iss, "aud": settings.jwt_aud, "iat": now, "exp": now + 3600
+        },
+        settings.jwt_secret,
+        algorithm=settings.jwt_algorithm
+    )
+
+
+def start_server(workers: int, port: int) -> subprocess.Popen:
+    """Arrancar gunicorn y esperar a que responda"""
+    env = dict(os.environ, WEB_CONCURRENCY=str(workers), SERVICE_PORT=str(port))
+    process = subprocess.Popen(
+        [sys.executable, "-m", "gunicorn", "-c", "gunicorn.conf.py", "--access-logfile", os.devnull,
+         "--log-level", "warning", "app.main:app"],
+        env=env
+    )
+    deadline = time.time() + 30
+    while time.time() < deadline:
+        try:
+            with urllib.request.urlopen(f"http://127.0.0.1:{port}/health/live", timeout=1) as response:
+                if response.status == 200:
+                    # Dar tiempo a que arranquen todos los workers
+                    time.sleep(1)
+                    return process
+        except OSError:
+            pass
+        time.sleep(0.2)
+    process.terminate()
+    raise RuntimeError(f"gunicorn no respondió en el puerto {port}")
+
+
+def client_process(port: int, path: str, token: str, threads: int, duration: float, results):
+    """Proceso cliente: varios hilos con conexiones keep-alive durante duration segundos"""
+    latencies, errors = [], []
+    deadline = time.perf_counter() + duration
+    headers = {"Authorization": f"Bearer {token}"}
+
+    def _worker():
+        conn = http.client.HTTPConnection("127.0.0.1", port, timeout=30)
+        try:
+            while time.perf_counter() < deadline:
+                start = time.perf_counter()
+                try:
+                    conn.request("GET", path, headers=headers)
+                    response = conn.getresponse()
+                    response.read()
+                    ok = response.status == 200
+                except (OSError, http.client.HTTPException):
+                    # Reabrir la conexión en la siguiente petición
+                    conn.close()
+                    ok = False
+                (latencies if ok else errors).append(time.perf_counter() - start)
+        finally:
+            conn.close()
+
+    pool = [threading.Thread(target=_worker) for _ in range(threads)]
+    for thread in pool:
+        thread.start()
+    for thread in pool:
+        thread.join()
+    results.put((latencies, len(errors)))
+
+
+def run_load(port: int, path: str, token: str, clients: int, concurrency: int, duration: float) -> tuple:
+    """Repartir la concurrencia entre procesos cliente para no saturar el GIL del generador"""
+    results = multiprocessing.Queue()
+    threads = max(concurrency // clients, 1)
+    processes = [
+        multiprocessing.Process(target=client_process, args=(port, path, token, threads, duration, results))
+        for _ in range(clients)
+    ]
+    for process in processes:
+        process.start()
+    latencies, errors = [], 0
+    for _ in processes:
+        chunk, failed = results.get()
+        latencies.extend(chunk)
+        errors += failed
+    for process in processes:
+        process.join()
+    return sorted(latencies), errors
+
+
+def main():
+    """Función principal"""
+    parser = argparse.ArgumentParser(description="Medir el escalado con el número de workers")
+    parser.add_argument('--workers', default='1,2,4', help='Números de workers a probar')
+    parser.add_argument('--duration', type=float, default=10)
+    parser.add_argument('--concurrency', type=int, default=32, help='Peticiones simultáneas')
+    parser.add_argument('--clients', type=int, default=max(multiprocessing.cpu_count() // 2, 1),
+                        help='Procesos generadores de carga')
+    parser.add_argument('--path', default='/analytics/occupancy')
+    parser.add_argument('--port', type=int, default=8765)
+    args = parser.parse_args()
+
+    token = admin_token()
+    print(f"📊 GET {args.path}: {args.concurrency} peticiones simultáneas durante {args.duration:.0f}s "
+          f"({multiprocessing.cpu_count()} núcleos)")
+
+    baseline = None
+    for workers in (int(n) for n in args.workers.split(',')):
+        server = start_server(workers, args.port)
+        try:
+            computed_before = stats_cache.computations
+            latencies, errors = run_load(args.port, args.path, token, args.clients, args.concurrency, args.duration)
+            computed = stats_cache.computations - computed_before
+        finally:
+            server.terminate()
+            server.wait()
+
+        throughput = len(latencies) / args.duration
+        baseline = baseline or throughput
+        if latencies:
+            p95 = latencies[int(len(latencies) * 0.95) - 1]
+            timing = f"p50={statistics.median(latencies) * 1000:7.2f} ms  p95={p95 * 1000:7.2f} ms"
+        else:
+            timing = "sin respuestas correctas"
+        print(f"  workers={workers:<3} {throughput:9.1f} req/s  x{throughput / baseline if baseline else 0:4.2f}  "
+              f"{timing}  errores={errors}  cálculos={computed}")
+
+
+if __name__ == '__main__':
+    main()
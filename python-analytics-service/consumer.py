@@ -3,8 +3,14 @@ Consumidor de RabbitMQ para procesar eventos de reservas
 """
 import json
 import logging
+import time
+from opentelemetry.trace import SpanKind, Status, StatusCode
 from app.rabbitmq import rabbitmq_client
 from app.config import get_settings
+from app.database import SessionLocal, engine
+from app.replica import local_replica
+from app.consumer_metrics import consumer_metrics, published_at
+from app.tracing import tracer, extract_context, setup_tracing
 
 logging.basicConfig(
     level=logging.INFO,
@@ -15,46 +21,121 @@ logger = logging.getLogger(__name__)
 settings = get_settings()
 
 
+def notify_occupancy_change(message: dict):
+    """
+    Publicar en el exchange fanout que la ocupación cambió
+    
+    Args:
+        message: Evento de reserva procesado
+    """
+    try:
+        rabbitmq_client.publish_to_exchange(
+            settings.rabbitmq_occupancy_exchange,
+            {"event": message.get('event'), "data": message.get('data')}
+        )
+    except Exception as e:
+        logger.warning(f"No se pudo notificar el cambio de ocupación: {e}")
+
+
+def sync_local_replica():
+    """Cargar el snapshot inicial o ponerse al día con los cambios perdidos"""
+    db = SessionLocal()
+    try:
+        local_replica.catch_up(db)
+    finally:
+        db.close()
+
+
+def resolve_pending_reservations():
+    """Completar desde PostgreSQL las reservas de eventos incompletos"""
+    db = SessionLocal()
+    try:
+        local_replica.resolve_pending(db)
+    finally:
+        db.close()
+
+
+def handle_event(message: dict):
+    """
+    Procesar un evento de reserva ya decodificado
+    
+    Args:
+        message: Evento recibido de RabbitMQ
+    """
+    # Procesar diferentes tipos de eventos
+    event_type = message.get('event')
+    
+    if event_type == 'reservation_created':
+        logger.info(f"Nueva reserva creada: {message.get('data')}")
+        # Aquí puedes agregar lógica para actualizar estadísticas en tiempo real
+        
+    elif event_type == 'reservation_updated':
+        logger.info(f"Reserva actualizada: {message.get('data')}")
+        
+    elif event_type == 'reservation_cancelled':
+        logger.info(f"Reserva cancelada: {message.get('data')}")
+    
+    if event_type and event_type.startswith('reservation_'):
+        # Aplicar el evento a la réplica local antes de avisar a la API
+        if settings.analytics_replica_enabled and not local_replica.apply_event(message):
+            resolve_pending_reservations()
+        
+        # Notificar a las instancias de la API para actualizar el feed en vivo
+        notify_occupancy_change(message)
+
+
 def callback(ch, method, properties, body):
     """
     Callback para procesar mensajes de RabbitMQ
     
+    El procesamiento se une a la traza del publicador mediante el
+    contexto propagado en las cabeceras del mensaje.
+    
     Args:
         ch: Canal
         method: Método
         properties: Propiedades
         body: Cuerpo del mensaje
     """
-    try:
-        message = json.loads(body)
-        logger.info(f"Mensaje recibido: {message}")
-        
-        # Procesar diferentes tipos de eventos
-        event_type = message.get('event')
-        
-        if event_type == 'reservation_created':
-            logger.info(f"Nueva reserva creada: {message.get('data')}")
-            # Aquí puedes agregar lógica para actualizar estadísticas en tiempo real
+    with tracer.start_as_current_span(
+        f"{settings.rabbitmq_queue} process",
+        context=extract_context(properties.headers),
+        kind=SpanKind.CONSUMER,
+        attributes={"messaging.system": "rabbitmq", "messaging.destination.name": settings.rabbitmq_queue}
+    ) as span:
+        start = time.perf_counter()
+        event_type = 'invalid'
+        message = {}
+        try:
+            message = json.loads(body)
+            logger.info(f"Mensaje recibido: {message}")
+            event_type = message.get('event') or 'unknown'
+            span.set_attribute("messaging.event", event_type)
             
-        elif event_type == 'reservation_updated':
-            logger.info(f"Reserva actualizada: {message.get('data')}")
+            handle_event(message)
             
-        elif event_type == 'reservation_cancelled':
-            logger.info(f"Reserva cancelada: {message.get('data')}")
-        
-        # Confirmar mensaje procesado
-        ch.basic_ack(delivery_tag=method.delivery_tag)
-        logger.info("Mensaje procesado exitosamente")
-        
-    except Exception as e:
-        logger.error(f"Error al procesar mensaje: {e}")
-        # Rechazar mensaje y reencolar
-        ch.basic_nack(delivery_tag=method.delivery_tag, requeue=True)
+            # Confirmar mensaje procesado
+            ch.basic_ack(delivery_tag=method.delivery_tag)
+            logger.info("Mensaje procesado exitosamente")
+            consumer_metrics.observe(event_type, time.perf_counter() - start, published_at(properties, message))
+            
+        except Exception as e:
+            logger.error(f"Error al procesar mensaje: {e}")
+            span.record_exception(e)
+            span.set_status(Status(StatusCode.ERROR))
+            # Rechazar mensaje y reencolar
+            ch.basic_nack(delivery_tag=method.delivery_tag, requeue=True)
+            consumer_metrics.observe(event_type, time.perf_counter() - start, None, ok=False)
 
 
 if __name__ == '__main__':
     try:
         logger.info("Iniciando consumidor de RabbitMQ...")
+        setup_tracing("analytics-consumer", engine)
+        consumer_metrics.serve(settings.consumer_metrics_port)
+        consumer_metrics.start_depth_sampler(settings.consumer_depth_sample_seconds)
+        if settings.analytics_replica_enabled:
+            sync_local_replica()
         rabbitmq_client.connect()
         rabbitmq_client.consume_messages(callback)
     except KeyboardInterrupt:
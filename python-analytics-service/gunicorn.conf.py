@@ -0,0 +1,35 @@
+"""
+Configuración de gunicorn para producción (varios workers uvicorn)
+
+Uso:
+    gunicorn -c gunicorn.conf.py app.main:app
+"""
+import multiprocessing
+import os
+
+bind = f"0.0.0.0:{os.getenv('SERVICE_PORT', '8000')}"
+worker_class = "uvicorn.workers.UvicornWorker"
+workers = int(os.getenv("WEB_CONCURRENCY", multiprocessing.cpu_count()))
+
+# Con workers uvicorn no es un timeout de petición ni de inactividad: el master
+# reinicia un worker si su event loop no envía el heartbeat en este tiempo
+# (p. ej. bloqueado por código síncrono). Las conexiones SSE largas no cuentan.
+timeout = int(os.getenv("GUNICORN_TIMEOUT", "120"))
+graceful_timeout = 30
+keepalive = 5
+
+# Con preload la aplicación se importa una vez en el master y se comparte por copy-on-write
+preload_app = os.getenv("GUNICORN_PRELOAD", "false").lower() == "true"
+
+accesslog = "-"
+
+
+def post_fork(server, worker):
+    """Descartar en cada worker las conexiones heredadas del master"""
+    from app.database import engine
+    from app.rabbitmq import rabbitmq_client
+
+    # close=False: los sockets del padre no se cierran desde el hijo
+    engine.dispose(close=False)
+    rabbitmq_client.reset_after_fork()
+    server.log.info(f"Worker {worker.pid} listo: conexiones a PostgreSQL y RabbitMQ propias")
@@ -0,0 +1,39 @@
+"""
+Reconstruir o poner al día la réplica analítica local
+
+Uso:
+    python rebuild_replica.py          # Ponerse al día desde la marca de agua
+    python rebuild_replica.py --full   # Snapshot completo desde PostgreSQL
+"""
+import argparse
+import json
+import logging
+from app.database import SessionLocal
+from app.replica import local_replica
+
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+)
+
+
+def main():
+    """Función principal"""
+    parser = argparse.ArgumentParser(description="Reconstruir la réplica analítica local")
+    parser.add_argument('--full', action='store_true', help='Descartar la réplica y cargar un snapshot completo')
+    args = parser.parse_args()
+
+    db = SessionLocal()
+    try:
+        if args.full:
+            local_replica.snapshot(db)
+        else:
+            local_replica.catch_up(db)
+    finally:
+        db.close()
+
+    print(json.dumps(local_replica.position(), indent=2))
+
+
+if __name__ == '__main__':
+    main()
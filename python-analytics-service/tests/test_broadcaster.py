@@ -0,0 +1,96 @@
+"""
+Tests del difusor SSE con muchos suscriptores simulados
+"""
+import asyncio
+import logging
+import tracemalloc
+from app.broadcaster import OccupancyBroadcaster, build_occupancy_payload
+
+FAST_SUBSCRIBERS = 500
+SLOW_SUBSCRIBERS = 50
+EVENTS = 20
+QUEUE_SIZE = 16
+
+# Cota holgada: cola acotada + tarea del cliente (~6 KB medidos con bench_sse.py)
+MAX_BYTES_PER_CONNECTION = 16 * 1024
+
+logging.getLogger("app.broadcaster").setLevel(logging.ERROR)
+
+
+def payload(seq: int) -> dict:
+    return build_occupancy_payload([
+        {"hotel_id": str(h), "total_reservations": 100 + seq, "active_reservations": 40, "occupancy_rate": 40.0}
+        for h in range(1, 6)
+    ])
+
+
+async def run_broadcast() -> dict:
+    """Difundir EVENTS eventos a suscriptores rápidos y lentos"""
+    broadcaster = OccupancyBroadcaster(max_queue_size=QUEUE_SIZE)
+    received = [0]
+
+    async def connected():
+        return False
+
+    async def fast_client():
+        subscriber = broadcaster.subscribe()
+        async for _ in broadcaster.stream(subscriber, connected, keepalive=60):
+            received[0] += 1
+
+    tracemalloc.start()
+    baseline = tracemalloc.get_traced_memory()[0]
+    tasks = [asyncio.create_task(fast_client()) for _ in range(FAST_SUBSCRIBERS)]
+    slow = [broadcaster.subscribe() for _ in range(SLOW_SUBSCRIBERS)]
+    await asyncio.sleep(0)
+
+    for seq in range(EVENTS):
+        broadcaster.publish(payload(seq))
+        # Dejar que los clientes rápidos vacíen su cola entre eventos
+        await asyncio.sleep(0.001)
+        await asyncio.sleep(0)
+
+    peak = tracemalloc.get_traced_memory()[1] - baseline
+    tracemalloc.stop()
+
+    result = {
+        "received": received[0],
+        "dropped": sum(1 for s in slow if s.dropped),
+        "slow_queued": [s.queue.qsize() for s in slow],
+        "subscribers": broadcaster.subscriber_count,
+        "peak_per_connection": peak / (FAST_SUBSCRIBERS + SLOW_SUBSCRIBERS)
+    }
+    for task in tasks:
+        task.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
+    return result
+
+
+def test_fast_subscribers_receive_every_frame_and_slow_ones_are_dropped():
+    result = asyncio.run(run_broadcast())
+
+    assert result["received"] == EVENTS * FAST_SUBSCRIBERS
+    assert result["dropped"] == SLOW_SUBSCRIBERS
+    # A los clientes caídos solo les queda la marca de cierre
+    assert result["slow_queued"] == [1] * SLOW_SUBSCRIBERS
+    assert result["subscribers"] == FAST_SUBSCRIBERS
+    assert result["peak_per_connection"] < MAX_BYTES_PER_CONNECTION
+
+
+def test_slow_subscriber_stream_ends_after_drop():
+    async def scenario():
+        broadcaster = OccupancyBroadcaster(max_queue_size=2)
+        subscriber = broadcaster.subscribe()
+        for seq in range(3):
+            broadcaster.publish(payload(seq))
+
+        async def connected():
+            return False
+
+        frames = [frame async for frame in broadcaster.stream(subscriber, connected, keepalive=1)]
+        return subscriber, frames, broadcaster
+
+    subscriber, frames, broadcaster = asyncio.run(scenario())
+    assert subscriber.dropped
+    assert frames == []
+    assert broadcaster.subscriber_count == 0
+    assert broadcaster.dropped_total == 1
@@ -0,0 +1,148 @@
+"""
+Tests de cancelación por plazo, de la propiedad de la sesión cancelada y de las métricas
+"""
+import asyncio
+import multiprocessing
+import os
+import threading
+import time
+import pytest
+from fastapi import HTTPException
+from sqlalchemy import create_engine, text
+from app import database
+from app.cancellation import CancellationMetrics, CancelToken, RequestCancelled, run_cancellable
+from app.config import get_settings
+from app.shared_cache import SharedSlot
+
+
+class FakeRequest:
+    def __init__(self, headers: dict, disconnect_after: float = None):
+        self.headers = headers
+        self._disconnect_at = time.perf_counter() + disconnect_after if disconnect_after else None
+
+    async def is_disconnected(self) -> bool:
+        return self._disconnect_at is not None and time.perf_counter() >= self._disconnect_at
+
+
+@pytest.fixture
+def sqlite_sessions(monkeypatch):
+    # La sesión se usa en el threadpool y se cierra en el hilo del event loop, como con psycopg
+    engine = create_engine("sqlite://", connect_args={"check_same_thread": False})
+    real = database.SessionLocal
+    monkeypatch.setattr(database, "SessionLocal", lambda: real(bind=engine))
+    monkeypatch.setattr(get_settings(), "cancel_grace_seconds", 0.05)
+
+
+def run_abandoned(request: FakeRequest):
+    """Ejecutar una consulta que no termina antes del plazo y devolver lo ocurrido"""
+    release = threading.Event()
+    calls = []
+
+    async def scenario():
+        gen = database.get_db()
+        db = next(gen)
+        close, invalidate = db.close, db.invalidate
+        db.close = lambda: calls.append(("close", threading.current_thread() is threading.main_thread())) or close()
+        db.invalidate = lambda: calls.append(("invalidate", threading.current_thread() is threading.main_thread())) or invalidate()
+
+        def slow():
+            db.execute(text("SELECT 1"))
+            release.wait(5)
+            db.execute(text("SELECT 2"))
+
+        with pytest.raises(HTTPException) as exc:
+            await run_cancellable(request, db, slow, "test", timeout=10)
+        # Teardown de la dependencia mientras el hilo sigue usando la sesión
+        gen.close()
+        teardown_calls = list(calls)
+
+        release.set()
+        for _ in range(100):
+            if any(name == "invalidate" for name, _ in calls):
+                break
+            await asyncio.sleep(0.01)
+        return exc.value, teardown_calls, calls
+
+    return asyncio.run(scenario())
+
+
+def test_deadline_returns_504_and_worker_thread_owns_cleanup(sqlite_sessions):
+    error, teardown_calls, calls = run_abandoned(FakeRequest({"X-Request-Timeout": "0.1"}))
+
+    assert error.status_code == 504
+    # get_db no cierra una sesión que otro hilo sigue usando
+    assert teardown_calls == []
+    # El hilo que la usaba la invalida al terminar
+    assert calls == [("invalidate", False)]
+
+
+def test_disconnect_returns_499(sqlite_sessions):
+    error, _, calls = run_abandoned(FakeRequest({}, disconnect_after=0.1))
+
+    assert error.status_code == 499
+    assert calls == [("invalidate", False)]
+
+
+def test_completed_request_is_closed_by_dependency(sqlite_sessions):
+    async def scenario():
+        gen = database.get_db()
+        db = next(gen)
+        result = await run_cancellable(FakeRequest({}), db, lambda: db.execute(text("SELECT 1")).scalar(), "test", 10)
+        gen.close()
+        return result, db
+
+    result, db = asyncio.run(scenario())
+    assert result == 1
+    assert not db.info.get(database.SESSION_HANDED_OFF)
+
+
+def test_cancel_after_finish_is_a_no_op():
+    token = CancelToken()
+    assert token.finish() is False
+    assert token.cancel("deadline") is False
+    token.check()
+
+
+def test_cancelled_token_blocks_new_statements():
+    token = CancelToken()
+    token.cancel("disconnect")
+    with pytest.raises(RequestCancelled):
+        token.check()
+
+
+def _worker_activity(path: str, cancels: int):
+    """Proceso hijo: un worker que completa una operación y cancela otras"""
+    metrics = CancellationMetrics(SharedSlot(path))
+    metrics.observe("occupancy", 1.0)
+    for _ in range(cancels):
+        metrics.record_cancel("occupancy", "deadline", 0.25)
+
+
+def test_metrics_are_aggregated_across_worker_processes(tmp_path):
+    path = str(tmp_path / "metrics.cache")
+    context = multiprocessing.get_context("fork")
+    workers = [context.Process(target=_worker_activity, args=(path, cancels)) for cancels in (1, 2)]
+    for process in workers:
+        process.start()
+    for process in workers:
+        process.join(10)
+        assert process.exitcode == 0
+
+    # El worker que atiende /metrics no ha cancelado nada y aun así ve los totales
+    snapshot = CancellationMetrics(SharedSlot(path)).snapshot()
+
+    assert snapshot["scope"] == "all_workers"
+    assert snapshot["workers"] == 3
+    assert snapshot["cancelled"] == {"disconnect": 0, "deadline": 3}
+    assert snapshot["db_seconds_saved"] == pytest.approx(3 * 0.75)
+    assert snapshot["operations"]["occupancy"] == {"completed": 2, "avg_ms": 1000.0}
+
+
+def test_metrics_without_shared_slot_are_labelled_per_worker():
+    metrics = CancellationMetrics()
+    metrics.record_cancel("hotel", "disconnect", 0.0)
+
+    snapshot = metrics.snapshot()
+    assert snapshot["scope"] == "worker"
+    assert snapshot["pids"] == [os.getpid()]
+    assert snapshot["cancelled_total"] == 1
@@ -0,0 +1,28 @@
+"""
+Tests de la cabecera de publicación y del cálculo de retraso del consumidor
+"""
+import time
+from types import SimpleNamespace
+from unittest.mock import MagicMock
+from app.consumer_metrics import published_at
+from app.rabbitmq import RabbitMQClient
+
+
+def test_publish_message_properties_encode_and_round_trip():
+    client = RabbitMQClient(max_retries=1)
+    client.connection = MagicMock(is_closed=False)
+    client.channel = MagicMock(is_closed=False)
+
+    before = time.time()
+    client.publish_message({"event": "reservation_created", "data": {"id": 1}}, retry=False)
+    properties = client.channel.basic_publish.call_args.kwargs["properties"]
+
+    # pika rechaza floats en las cabeceras: debe codificarse sin errores
+    properties.encode()
+    assert before - 0.001 <= published_at(properties, {}) <= time.time()
+
+
+def test_published_at_falls_back_to_body_timestamp():
+    properties = SimpleNamespace(headers=None, timestamp=None)
+    assert published_at(properties, {"timestamp": "2024-01-01T10:00:00"}) is not None
+    assert published_at(properties, {}) is None
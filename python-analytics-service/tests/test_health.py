@@ -0,0 +1,82 @@
+"""
+Tests de las sondas de readiness con la base de datos o el broker caídos
+"""
+import asyncio
+import json
+import pytest
+from pika.exceptions import AMQPConnectionError
+from sqlalchemy import create_engine
+from app import health
+from app.health import HealthMonitor
+from app.main import readiness_check
+
+
+@pytest.fixture
+def monitor(monkeypatch, tmp_path):
+    monitor = HealthMonitor(interval=60, lag_threshold=100)
+    # readiness_check usa la instancia importada en app.main
+    monkeypatch.setattr("app.main.health_monitor", monitor)
+    monkeypatch.setattr(health, "engine", create_engine(f"sqlite:///{tmp_path}/up.db"))
+    monkeypatch.setattr(monitor._rabbitmq, "get_queue_stats", lambda: {"message_count": 3, "consumer_count": 1})
+    monkeypatch.setattr(monitor._rabbitmq, "close", lambda: None)
+    return monitor
+
+
+def ready() -> tuple:
+    response = asyncio.run(readiness_check())
+    return response.status_code, json.loads(response.body)
+
+
+def test_all_dependencies_up_is_ready(monitor):
+    monitor.check()
+
+    status_code, body = ready()
+    assert status_code == 200
+    assert body["status"] == "ready"
+    assert body["dependencies"]["consumer"]["queue_depth"] == 3
+
+
+def test_database_down_is_not_ready(monitor, monkeypatch, tmp_path):
+    # Directorio inexistente: SQLite no puede abrir la base de datos
+    monkeypatch.setattr(health, "engine", create_engine(f"sqlite:///{tmp_path}/missing/down.db"))
+    monitor.check()
+
+    status_code, body = ready()
+    assert status_code == 503
+    assert body["status"] == "not_ready"
+    assert body["dependencies"]["database"]["status"] == "down"
+    assert "error" in body["dependencies"]["database"]
+
+
+def test_broker_down_degrades_but_stays_ready(monitor, monkeypatch):
+    def unreachable():
+        raise AMQPConnectionError("connection refused")
+
+    monkeypatch.setattr(monitor._rabbitmq, "get_queue_stats", unreachable)
+    monitor.check()
+
+    status_code, body = ready()
+    assert status_code == 200
+    assert body["status"] == "degraded"
+    assert body["dependencies"]["rabbitmq"]["status"] == "down"
+    assert body["dependencies"]["consumer"]["status"] == "unknown"
+
+
+@pytest.mark.parametrize("stats, expected", [
+    ({"message_count": 500, "consumer_count": 1}, "lagging"),
+    ({"message_count": 0, "consumer_count": 0}, "down"),
+])
+def test_consumer_problems_degrade_readiness(monitor, monkeypatch, stats, expected):
+    monkeypatch.setattr(monitor._rabbitmq, "get_queue_stats", lambda: stats)
+    monitor.check()
+
+    status_code, body = ready()
+    assert status_code == 200
+    assert body["status"] == "degraded"
+    assert body["dependencies"]["consumer"]["status"] == expected
+
+
+def test_readiness_before_first_check_is_not_ready(monitor):
+    status_code, body = ready()
+    assert status_code == 503
+    assert body["dependencies"]["database"]["status"] == "unknown"
@@ -0,0 +1,47 @@
+"""
+Tests del scheduler de vistas materializadas (sin PostgreSQL)
+"""
+from app import materialized_views
+from app.materialized_views import MaterializedViewScheduler
+
+
+def run_once(monkeypatch, scheduler: MaterializedViewScheduler, age):
+    """Ejecutar una ronda del scheduler y devolver el max_age usado y la espera siguiente"""
+    calls, waits = [], []
+    monkeypatch.setattr(materialized_views, "refresh_views", lambda max_age=None: calls.append(max_age) or age)
+    scheduler._views_ready = True
+
+    def wait(timeout):
+        waits.append(timeout)
+        scheduler._stop.set()
+
+    monkeypatch.setattr(scheduler._wake, "wait", wait)
+    scheduler._run()
+    return calls[0], waits[0]
+
+
+def test_periodic_round_skips_if_another_replica_refreshed_within_interval(monkeypatch):
+    scheduler = MaterializedViewScheduler(interval=60, event_threshold=50)
+    max_age, wait = run_once(monkeypatch, scheduler, age=20.0)
+
+    assert max_age == 60
+    # Despierta cuando vence el refresco de la otra réplica, no un intervalo completo después
+    assert wait == 40.0
+
+
+def test_event_threshold_only_accepts_refreshes_started_after_it(monkeypatch):
+    scheduler = MaterializedViewScheduler(interval=60, event_threshold=2)
+    scheduler.note_event()
+    scheduler.note_event()
+    max_age, wait = run_once(monkeypatch, scheduler, age=0.0)
+
+    assert 0 <= max_age < 1
+    assert wait == 60
+    assert scheduler._events == 0 and scheduler._threshold_at is None
+
+
+def test_lock_held_elsewhere_waits_full_interval(monkeypatch):
+    scheduler = MaterializedViewScheduler(interval=60, event_threshold=50)
+    _, wait = run_once(monkeypatch, scheduler, age=None)
+
+    assert wait == 60
@@ -0,0 +1,62 @@
+"""
+Tests de execute_pipelined con drivers sin modo pipeline (SQLite)
+"""
+from datetime import datetime
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import Session
+from app.cancellation import CancelToken, RequestCancelled
+from app.database import Base
+from app.models import Reservation
+from app.queries import HOTEL_COUNTS, HOTEL_TOTALS, STATUS_COUNTS, execute_pipelined
+from bench_queries import frontend_message
+
+
+@pytest.fixture
+def db():
+    engine = create_engine("sqlite://")
+    Base.metadata.create_all(engine)
+    session = Session(bind=engine)
+    now = datetime(2024, 1, 1)
+    session.add_all([
+        Reservation(id=i, user_id=1, hotel_id=hotel, room_type="double", check_in=now, check_out=now, status=status)
+        for i, (hotel, status) in enumerate(
+            [("1", "confirmed"), ("1", "cancelled"), ("2", "confirmed"), ("2", "completed")], start=1
+        )
+    ])
+    session.commit()
+    yield session
+    session.close()
+
+
+def test_fallback_runs_statements_in_order_with_bound_literals(db):
+    by_status, by_hotel, hotel = execute_pipelined(db, [
+        (STATUS_COUNTS, {}),
+        (HOTEL_COUNTS, {}),
+        (HOTEL_TOTALS, {"hotel_id": "1"})
+    ])
+
+    assert sorted((row.status, row.count) for row in by_status) == [("cancelled", 1), ("completed", 1), ("confirmed", 2)]
+    # 'active' usa el literal 'confirmed' enlazado en la sentencia
+    assert sorted((row.hotel_id, row.count, row.active) for row in by_hotel) == [("1", 2, 1), ("2", 2, 1)]
+    assert [(row.count, row.active) for row in hotel] == [(2, 1)]
+
+
+def test_fallback_does_not_run_statements_for_cancelled_request(db):
+    token = CancelToken()
+    token.cancel("disconnect")
+    db.info["cancel_token"] = token
+
+    with pytest.raises(RequestCancelled):
+        execute_pipelined(db, [(STATUS_COUNTS, {})])
+
+
+def test_round_trips_are_counted_from_frontend_sync_messages():
+    trace = [
+        "F\t31\tQuery\t \"BEGIN\"",
+        "B\t5\tReadyForQuery\t T",
+        "F\t68\tParse\t \"\" \"SELECT 1\" 0",
+        "2024-01-01 10:00:00.000000\tF\t4\tSync",
+        "B\t4\tParseComplete",
+    ]
+    assert [frontend_message(line) for line in trace] == ["Query", None, "Parse", "Sync", None]
@@ -0,0 +1,66 @@
+"""
+Tests de la réplica analítica local (SQLite)
+"""
+from datetime import datetime
+import pytest
+from app.replica import LocalReplica
+
+
+@pytest.fixture
+def replica(tmp_path):
+    replica = LocalReplica(str(tmp_path / "replica.db"))
+    replica.initialize()
+    with replica._connect() as conn:
+        replica._set_state(conn, snapshot_at=datetime.now(), watermark=datetime.now(), events_applied=0)
+    return replica
+
+
+def event(event_type: str, timestamp: str, **data) -> dict:
+    return {"event": event_type, "timestamp": timestamp, "data": data}
+
+
+def rows(replica: LocalReplica) -> list:
+    with replica._connect() as conn:
+        return conn.execute("SELECT id, hotel_id, status, updated_at FROM reservations ORDER BY id").fetchall()
+
+
+def test_older_event_does_not_roll_back_newer_row(replica):
+    replica.apply_event(event("reservation_created", "2024-01-01T10:00:00", id=1, hotel_id=1,
+                              room_type="double", status="confirmed", updated_at="2024-01-01T12:00:00.000000"))
+    # Evento acumulado en la cola, anterior al estado cargado por catch_up
+    replica.apply_event(event("reservation_updated", "2024-01-01T09:00:00", id=1, hotel_id=1,
+                              room_type="double", status="pending", updated_at="2024-01-01T11:00:00+00:00"))
+
+    assert rows(replica)[0].status == "confirmed"
+
+
+def test_stale_event_is_not_counted_and_keeps_position(replica):
+    assert replica.apply_event(event("reservation_updated", "2024-01-01T12:00:00", id=1, hotel_id=1,
+                                     room_type="double", status="confirmed", updated_at="2024-01-01T12:00:00"))
+    before = replica.position()
+
+    applied = replica.apply_event(event("reservation_updated", "2024-01-01T09:00:00", id=1, hotel_id=1,
+                                        room_type="double", status="pending", updated_at="2024-01-01T09:00:00"))
+
+    assert applied is False
+    assert rows(replica)[0].status == "confirmed"
+    assert replica.position() == before
+    assert before["events_applied"] == 1
+
+
+def test_newer_event_without_updated_at_uses_message_timestamp(replica):
+    replica.apply_event(event("reservation_created", "2024-01-01T10:00:00", id=1, hotel_id=1,
+                              room_type="double", status="confirmed", updated_at="2024-01-01T10:00:00"))
+    replica.apply_event(event("reservation_cancelled", "2024-01-01T10:05:00Z", id=1))
+
+    assert rows(replica)[0].status == "cancelled"
+
+
+def test_incomplete_event_for_unknown_reservation_is_flagged_not_inserted(replica):
+    applied = replica.apply_event(event("reservation_cancelled", "2024-01-01T10:00:00", id=7))
+
+    assert applied is False
+    assert rows(replica) == []
+    with replica._connect() as conn:
+        assert [r.id for r in conn.execute("SELECT id FROM pending_lookups").fetchall()] == [7]
+    assert all(r.hotel_id is not None for r in replica.fetch_breakdowns()["by_hotel"])
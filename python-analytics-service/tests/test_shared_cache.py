@@ -0,0 +1,61 @@
+"""
+Tests de la caché compartida entre workers
+"""
+import multiprocessing
+import time
+from datetime import datetime
+from app.schemas import DataFreshness, OccupancyStats
+from app.shared_cache import SharedBreakdownCache, SharedStatsCache
+
+
+def live_stats():
+    stats = OccupancyStats(
+        total_reservations=1, active_reservations=1, completed_reservations=0, cancelled_reservations=0,
+        occupancy_rate=100.0, by_hotel=[], by_room_type=[], by_status=[]
+    )
+    return stats, DataFreshness(source="live", refreshed_at=datetime.now(), staleness_seconds=0.0)
+
+
+def test_cache_hit_reports_time_spent_in_cache(tmp_path):
+    cache = SharedStatsCache(str(tmp_path / "stats.cache"), ttl=60)
+    cache.get_or_compute(live_stats)
+    time.sleep(0.2)
+
+    stats, freshness = cache.get_or_compute(lambda: (_ for _ in ()).throw(AssertionError("no debe recalcular")))
+
+    assert stats.total_reservations == 1
+    assert freshness.staleness_seconds >= 0.2
+    assert cache.computations == 1
+
+
+def _feed_worker(path: str, not_before: float, results):
+    cache = SharedBreakdownCache(path)
+
+    def compute():
+        time.sleep(0.3)
+        return [{"hotel_id": "1", "total_reservations": 10}]
+
+    results.put(cache.get_or_compute(not_before, compute))
+
+
+def test_breakdown_is_computed_once_for_all_workers(tmp_path):
+    path = str(tmp_path / "by_hotel.cache")
+    not_before = time.time()
+    results = multiprocessing.Queue()
+    workers = [multiprocessing.Process(target=_feed_worker, args=(path, not_before, results)) for _ in range(4)]
+    for worker in workers:
+        worker.start()
+    values = [results.get(timeout=10) for _ in workers]
+    for worker in workers:
+        worker.join()
+
+    assert all(v == [{"hotel_id": "1", "total_reservations": 10}] for v in values)
+    assert SharedBreakdownCache(path).computations == 1
+
+
+def test_breakdown_older_than_notification_is_recomputed(tmp_path):
+    cache = SharedBreakdownCache(str(tmp_path / "by_hotel.cache"))
+    cache.get_or_compute(time.time(), lambda: ["old"])
+
+    assert cache.get_or_compute(time.time(), lambda: ["new"]) == ["new"]
+    assert cache.computations == 2
@@ -0,0 +1,167 @@
+"""
+Tests de las trazas: middleware HTTP, consumo de RabbitMQ y sentencias SQL
+"""
+import asyncio
+import json
+import threading
+import time
+from contextlib import contextmanager
+from types import SimpleNamespace
+from unittest.mock import MagicMock
+import pytest
+from fastapi import Depends, FastAPI, Request
+from opentelemetry import trace
+from opentelemetry.sdk.trace import TracerProvider
+from opentelemetry.sdk.trace.export import SimpleSpanProcessor
+from opentelemetry.sdk.trace.export.in_memory_span_exporter import InMemorySpanExporter
+from sqlalchemy import create_engine, text
+from sqlalchemy.orm import Session
+from app import database
+from app.broadcaster import OccupancyBroadcaster
+from app.cancellation import run_cancellable
+from app.config import get_settings
+from app.queries import HOTEL_TOTALS, STATUS_COUNTS, execute_pipelined
+from app.services.occupancy_feed import OccupancyFeed
+from app.tracing import TracingMiddleware, inject_headers, instrument_engine, tracer
+
+_exporter = InMemorySpanExporter()
+
+
+@pytest.fixture
+def spans():
+    # El proveedor global solo se puede fijar una vez por proceso
+    if not isinstance(trace.get_tracer_provider(), TracerProvider):
+        provider = TracerProvider()
+        provider.add_span_processor(SimpleSpanProcessor(_exporter))
+        trace.set_tracer_provider(provider)
+    _exporter.clear()
+    return _exporter
+
+
+@pytest.fixture
+def sqlite_sessions(monkeypatch):
+    engine = create_engine("sqlite://", connect_args={"check_same_thread": False})
+    real = database.SessionLocal
+    monkeypatch.setattr(database, "SessionLocal", lambda: real(bind=engine))
+    monkeypatch.setattr(get_settings(), "cancel_grace_seconds", 0.05)
+
+
+async def call_and_disconnect(app, path: str, disconnect_after: float) -> list:
+    """Petición ASGI cuyo receive se comporta como el de uvicorn: bloquea hasta la desconexión"""
+    disconnected = asyncio.Event()
+    request_sent = False
+    sent = []
+
+    async def receive():
+        nonlocal request_sent
+        if not request_sent:
+            request_sent = True
+            return {"type": "http.request", "body": b"", "more_body": False}
+        await disconnected.wait()
+        return {"type": "http.disconnect"}
+
+    async def send(message):
+        sent.append(message)
+
+    scope = {
+        "type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1", "method": "GET",
+        "scheme": "http", "path": path, "raw_path": path.encode(), "root_path": "", "query_string": b"",
+        "headers": [(b"host", b"testserver")], "client": ("127.0.0.1", 1234), "server": ("testserver", 80)
+    }
+    asyncio.get_running_loop().call_later(disconnect_after, disconnected.set)
+    await app(scope, receive, send)
+    return sent
+
+
+def test_client_disconnect_cancels_query_with_tracing_enabled(spans, sqlite_sessions):
+    release = threading.Event()
+    app = FastAPI()
+    app.add_middleware(TracingMiddleware)
+
+    @app.get("/slow/{item_id}")
+    async def slow(item_id: int, request: Request, db: Session = Depends(database.get_db)):
+        def work():
+            db.execute(text("SELECT 1"))
+            release.wait(5)
+        await run_cancellable(request, db, work, "test", timeout=10)
+
+    start = time.perf_counter()
+    try:
+        sent = asyncio.run(call_and_disconnect(app, "/slow/1", disconnect_after=0.1))
+    finally:
+        release.set()
+    elapsed = time.perf_counter() - start
+
+    # La desconexión llega al endpoint: 499 mucho antes del plazo de 10 s
+    assert sent[0]["status"] == 499
+    assert elapsed < 2
+
+    [span] = spans.get_finished_spans()
+    assert span.name == "GET /slow/{item_id}"
+    assert span.kind == trace.SpanKind.SERVER
+    assert span.attributes["http.status_code"] == 499
+    assert span.attributes["http.target"] == "/slow/1"
+
+
+def test_feed_message_continues_publisher_trace(spans):
+    feed = OccupancyFeed(OccupancyBroadcaster(), debounce=0.1)
+    feed._pending = False
+    with tracer.start_as_current_span("publish") as parent:
+        headers = inject_headers()
+    body = json.dumps({"event": "reservation_created", "data": {"id": 1}})
+
+    feed._on_message(None, None, SimpleNamespace(headers=headers), body)
+
+    consume = next(span for span in spans.get_finished_spans() if span.kind == trace.SpanKind.CONSUMER)
+    assert consume.context.trace_id == parent.get_span_context().trace_id
+    assert consume.parent.span_id == parent.get_span_context().span_id
+    assert consume.attributes["messaging.event"] == "reservation_created"
+    assert feed._pending
+
+
+class FakePipelineConnection:
+    """Conexión psycopg mínima: registra las sentencias enviadas en el pipeline"""
+
+    def __init__(self):
+        self.executed = []
+
+    @contextmanager
+    def pipeline(self):
+        yield
+
+    def cursor(self, row_factory=None):
+        connection = self
+
+        class Cursor:
+            def execute(self, query, params, prepare=None):
+                connection.executed.append(query)
+
+            def fetchall(self):
+                return []
+
+        return Cursor()
+
+
+def test_pipelined_statements_get_one_child_span_each(spans):
+    driver = FakePipelineConnection()
+    db = MagicMock()
+    db.info = {}
+    db.connection.return_value.connection.driver_connection = driver
+
+    execute_pipelined(db, [(STATUS_COUNTS, {}), (HOTEL_TOTALS, {"hotel_id": 1})])
+
+    finished = spans.get_finished_spans()
+    pipeline = next(span for span in finished if span.name == "db pipeline")
+    children = [span for span in finished if span.parent is not None and span.parent.span_id == pipeline.context.span_id]
+    assert [span.attributes["db.statement"] for span in children] == driver.executed
+    assert {span.name for span in children} == {"db SELECT"}
+
+
+def test_engine_statements_get_one_span_each(spans):
+    engine = create_engine("sqlite://")
+    instrument_engine(engine)
+    with engine.connect() as conn:
+        conn.execute(text("SELECT 1"))
+        conn.execute(text("SELECT 2"))
+
+    assert [span.attributes["db.statement"] for span in spans.get_finished_spans()] == ["SELECT 1", "SELECT 2"]